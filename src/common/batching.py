@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from collections import deque
+
+
+class BatchController:
+    """Sizes sink batches from commit latency, backlog and a latency target.
+
+    Latency is measured inside the consumer: from the moment an event is
+    handed to the sink until the transaction holding it has committed. After
+    every flush the controller looks at the backlog and the p99 of recent
+    latencies and makes one decision:
+
+    - grow:   more events are waiting than one batch holds, so batches double
+              (up to max_size) to amortise commits and drain the backlog
+    - shrink: p99 is over target, so batch size and flush interval halve
+    - relax:  p99 is well under target and traffic is sparse, so the flush
+              interval grows a little (fewer commits for the same freshness)
+    - fit:    traffic is sparse, the batch size follows what actually arrives
+    - hold:   nothing to change
+    """
+
+    def __init__(self, target_p99_ms: float = 500.0, min_size: int = 1, max_size: int = 5000, initial_size: int = 100, min_interval: float = 0.01, max_interval: float = 2.0, window: int = 200):
+        self.target = target_p99_ms / 1000.0
+        self.min_size = min_size
+        self.max_size = max_size
+        self.batch_size = max(min_size, min(initial_size, max_size))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.flush_interval = min(max_interval, max(min_interval, self.target / 2))
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.commit_latency = 0.0
+        self.backlog: int | None = None
+        self.decision = "hold"
+
+    def should_flush(self, pending: int, oldest_age: float) -> bool:
+        return pending > 0 and (pending >= self.batch_size or oldest_age >= self.flush_interval)
+
+    def time_to_flush(self, pending: int, oldest_age: float) -> float | None:
+        """Seconds until should_flush() turns true, None while nothing is pending"""
+        if pending <= 0:
+            return None
+        if pending >= self.batch_size:
+            return 0.0
+        return max(0.0, self.flush_interval - oldest_age)
+
+    def p99(self) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+    def record_flush(self, size: int, commit_latency: float, oldest_latency: float, newest_latency: float, backlog: int | None = None) -> str:
+        """Feed back one flush and adapt; returns the decision taken"""
+        self.commit_latency = commit_latency
+        self.backlog = backlog
+        self.latencies.append(oldest_latency)
+        self.latencies.append(newest_latency)
+        p99 = self.p99()
+
+        if backlog is not None and backlog > self.batch_size and self.batch_size < self.max_size:
+            self.batch_size = min(self.max_size, self.batch_size * 2)
+            self.decision = "grow"
+        elif p99 > self.target:
+            self.batch_size = max(self.min_size, self.batch_size // 2)
+            self.flush_interval = max(self.min_interval, self.flush_interval / 2)
+            self.decision = "shrink"
+        elif size < self.batch_size and not backlog:
+            if p99 < self.target / 2 and self.flush_interval < self.max_interval:
+                # keep room for the commit itself inside the target
+                ceiling = min(self.max_interval, max(self.min_interval, self.target - 2 * commit_latency))
+                self.flush_interval = min(ceiling, self.flush_interval * 1.25)
+                self.decision = "relax"
+            else:
+                self.batch_size = max(self.min_size, size)
+                self.decision = "fit"
+        else:
+            self.decision = "hold"
+        return self.decision
+
+    def describe(self) -> str:
+        backlog = "?" if self.backlog is None else self.backlog
+        return (
+            f"batch={self.batch_size} interval={self.flush_interval * 1000:.0f}ms "
+            f"commit={self.commit_latency * 1000:.1f}ms p99={self.p99() * 1000:.1f}ms "
+            f"backlog={backlog} decision={self.decision}"
+        )
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterator, get_args
+
+import numpy as np
+
+from src.common.models import OrderEvent
+
+# code → value for the fixed enums; the code is the position in the tuple
+STATUSES: tuple[str, ...] = get_args(OrderEvent.model_fields["status"].annotation)
+EVENT_TYPES: tuple[str, ...] = get_args(OrderEvent.model_fields["event_type"].annotation)
+CURRENCIES: tuple[str, ...] = get_args(OrderEvent.model_fields["currency"].annotation)
+
+_STATUS_CODES = {v: i for i, v in enumerate(STATUSES)}
+_EVENT_TYPE_CODES = {v: i for i, v in enumerate(EVENT_TYPES)}
+_CURRENCY_CODES = {v: i for i, v in enumerate(CURRENCIES)}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_CENT = Decimal("0.01")
+_MICRO = timedelta(microseconds=1)
+
+# limits of the typed arrays (and of the segment file columns)
+_INT64_MAX = 2**63 - 1
+_INT32_MAX = 2**31 - 1
+_MAX_CATEGORIES = 2**16
+
+# dictionary-encoded columns that --group-by and the filters understand
+ENCODED = ("status", "event_type", "currency", "category")
+
+
+def to_cents(amount: Decimal) -> int:
+    """Amount in integer cents, rounded like NUMERIC(10,2) (half away from zero)"""
+    return int(Decimal(amount).quantize(_CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def to_micros(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - EPOCH) // _MICRO
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def micros_to_datetime(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+def _take(strings, idx: np.ndarray):
+    # lazily decoded string columns (segments) know how to select themselves
+    if hasattr(strings, "take"):
+        return strings.take(idx)
+    return [strings[i] for i in idx.tolist()]
+
+
+class EventBatch:
+    """A batch of validated events stored column by column.
+
+    Amounts are int64 cents, timestamps int64 epoch microseconds, the enums
+    small-int codes into STATUSES/EVENT_TYPES/CURRENCIES, category a code into
+    the batch's `categories` list and ids interned strings (or any sequence of
+    str, such as a segment's lazily decoded column). Aggregations run as NumPy
+    operations over whole columns.
+    """
+
+    def __init__(self, event_id: list[str], order_id: list[str], customer_id: list[str], event_ts: np.ndarray, amount_cents: np.ndarray, items_count: np.ndarray, status: np.ndarray, event_type: np.ndarray, currency: np.ndarray, category: np.ndarray, categories: list[str]):
+        self.event_id = event_id
+        self.order_id = order_id
+        self.customer_id = customer_id
+        self.event_ts = event_ts
+        self.amount_cents = amount_cents
+        self.items_count = items_count
+        self.status = status
+        self.event_type = event_type
+        self.currency = currency
+        self.category = category
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.amount_cents)
+
+    def __getitem__(self, rows: slice) -> "EventBatch":
+        return self.take(np.arange(len(self))[rows])
+
+    @classmethod
+    def from_events(cls, events: list[OrderEvent], categories: list[str] | None = None) -> "EventBatch":
+        builder = EventBatchBuilder(categories)
+        for evt in events:
+            builder.append(evt)
+        return builder.build()
+
+    def dictionary(self, field: str) -> tuple[str, ...] | list[str]:
+        if field == "status":
+            return STATUSES
+        if field == "event_type":
+            return EVENT_TYPES
+        if field == "currency":
+            return CURRENCIES
+        if field == "category":
+            return self.categories
+        raise ValueError(f"Not a dictionary-encoded field: {field}")
+
+    def codes_for(self, field: str, values) -> list[int]:
+        """Codes of `values` in `field`'s dictionary; unknown values are skipped"""
+        lookup = {v: i for i, v in enumerate(self.dictionary(field))}
+        return [lookup[v] for v in values if v in lookup]
+
+    def take(self, selector: np.ndarray) -> "EventBatch":
+        """Rows picked by a boolean mask or an index array"""
+        idx = np.flatnonzero(selector) if selector.dtype == bool else selector
+        return EventBatch(
+            _take(self.event_id, idx),
+            _take(self.order_id, idx),
+            _take(self.customer_id, idx),
+            self.event_ts[idx], self.amount_cents[idx], self.items_count[idx],
+            self.status[idx], self.event_type[idx], self.currency[idx], self.category[idx],
+            self.categories,
+        )
+
+    # ---- aggregations ----
+    def counts(self, field: str) -> Counter:
+        names = self.dictionary(field)
+        bins = np.bincount(getattr(self, field), minlength=len(names))
+        return Counter({names[i]: int(n) for i, n in enumerate(bins) if n})
+
+    def totals_by(self, field: str) -> dict[str, Decimal]:
+        names = self.dictionary(field)
+        sums = np.zeros(len(names), dtype=np.int64)
+        np.add.at(sums, getattr(self, field), self.amount_cents)
+        present = np.bincount(getattr(self, field), minlength=len(names))
+        return {names[i]: cents_to_decimal(sums[i]) for i in np.flatnonzero(present)}
+
+    def total_cents(self) -> int:
+        return int(self.amount_cents.sum())
+
+    def min_cents(self) -> int | None:
+        return int(self.amount_cents.min()) if len(self) else None
+
+    def max_cents(self) -> int | None:
+        return int(self.amount_cents.max()) if len(self) else None
+
+    # ---- row views for sinks ----
+    def iter_rows(self) -> Iterator[tuple]:
+        """Rows in OrderEvent field order with Python values (Decimal amount, UTC datetime)"""
+        cats = self.categories
+        for i, (ts, cents, items, st, et, cur, cat) in enumerate(zip(
+            self.event_ts.tolist(), self.amount_cents.tolist(), self.items_count.tolist(),
+            self.status.tolist(), self.event_type.tolist(), self.currency.tolist(), self.category.tolist(),
+        )):
+            yield (
+                self.event_id[i], EVENT_TYPES[et], micros_to_datetime(ts), self.order_id[i],
+                self.customer_id[i], STATUSES[st], cents_to_decimal(cents), CURRENCIES[cur], items, cats[cat],
+            )
+
+    def to_events(self) -> list[OrderEvent]:
+        fields = list(OrderEvent.model_fields)
+        return [OrderEvent.model_construct(**dict(zip(fields, row))) for row in self.iter_rows()]
+
+
+class BatchStats:
+    """Running totals over a stream of EventBatches (what --summary reports)"""
+
+    def __init__(self, group_by: str | None = None):
+        if group_by is not None and group_by not in ENCODED:
+            raise ValueError(f"Cannot group by {group_by!r}. Allowed: {', '.join(ENCODED)}")
+        self.group_by = group_by
+        self.count = 0
+        self.total_cents = 0
+        self.min_cents: int | None = None
+        self.max_cents: int | None = None
+        self.status_counts: Counter = Counter()
+        self.type_counts: Counter = Counter()
+        self.group_totals: dict[str, Decimal] = defaultdict(Decimal)
+
+    def add(self, batch: EventBatch) -> None:
+        if not len(batch):
+            return
+        self.count += len(batch)
+        self.total_cents += batch.total_cents()
+        lo, hi = batch.min_cents(), batch.max_cents()
+        self.min_cents = lo if self.min_cents is None else min(self.min_cents, lo)
+        self.max_cents = hi if self.max_cents is None else max(self.max_cents, hi)
+        self.status_counts.update(batch.counts("status"))
+        self.type_counts.update(batch.counts("event_type"))
+        if self.group_by:
+            for key, amt in batch.totals_by(self.group_by).items():
+                self.group_totals[key] += amt
+
+    @property
+    def total(self) -> Decimal:
+        return cents_to_decimal(self.total_cents)
+
+    @property
+    def min_amount(self) -> Decimal | None:
+        return None if self.min_cents is None else cents_to_decimal(self.min_cents)
+
+    @property
+    def max_amount(self) -> Decimal | None:
+        return None if self.max_cents is None else cents_to_decimal(self.max_cents)
+
+
+class EventBatchBuilder:
+    """Appends validated events into typed arrays, then freezes them into an EventBatch.
+
+    Pass the same `categories` list to several builders to keep category
+    codes stable across batches.
+    """
+
+    def __init__(self, categories: list[str] | None = None):
+        self.categories = categories if categories is not None else []
+        self._category_codes = {v: i for i, v in enumerate(self.categories)}
+        self.event_id: list[str] = []
+        self.order_id: list[str] = []
+        self.customer_id: list[str] = []
+        self.event_ts = array("q")
+        self.amount_cents = array("q")
+        self.items_count = array("i")
+        self.status = array("B")
+        self.event_type = array("B")
+        self.currency = array("B")
+        self.category = array("H")
+
+    def __len__(self) -> int:
+        return len(self.amount_cents)
+
+    def append(self, evt: OrderEvent) -> None:
+        """Add one event; raises ValueError, leaving the builder unchanged, if it does not fit the column types"""
+        cents = to_cents(evt.amount)
+        if cents > _INT64_MAX:
+            raise ValueError(f"amount {evt.amount} is too large")
+        if evt.items_count > _INT32_MAX:
+            raise ValueError(f"items_count {evt.items_count} is too large")
+        code = self._category_codes.get(evt.category)
+        if code is None:
+            if len(self.categories) >= _MAX_CATEGORIES:
+                raise ValueError(f"more than {_MAX_CATEGORIES} distinct categories")
+            code = self._category_codes[evt.category] = len(self.categories)
+            self.categories.append(sys.intern(evt.category))
+        self.event_id.append(sys.intern(evt.event_id))
+        self.order_id.append(sys.intern(evt.order_id))
+        self.customer_id.append(sys.intern(evt.customer_id))
+        self.event_ts.append(to_micros(evt.event_ts))
+        self.amount_cents.append(cents)
+        self.items_count.append(evt.items_count)
+        self.status.append(_STATUS_CODES[evt.status])
+        self.event_type.append(_EVENT_TYPE_CODES[evt.event_type])
+        self.currency.append(_CURRENCY_CODES[evt.currency])
+        self.category.append(code)
+
+    def build(self) -> EventBatch:
+        """Freeze into an EventBatch; the arrays are shared, not copied, so stop appending"""
+        return EventBatch(
+            self.event_id, self.order_id, self.customer_id,
+            np.frombuffer(self.event_ts, dtype=np.int64),
+            np.frombuffer(self.amount_cents, dtype=np.int64),
+            np.frombuffer(self.items_count, dtype=np.int32),
+            np.frombuffer(self.status, dtype=np.uint8),
+            np.frombuffer(self.event_type, dtype=np.uint8),
+            np.frombuffer(self.currency, dtype=np.uint8),
+            np.frombuffer(self.category, dtype=np.uint16),
+            self.categories,
+        )
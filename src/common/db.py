@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from src.common.columnar import BatchStats, cents_to_decimal
+
+# Postgres Configuration
+PG_HOST = os.getenv("PG_HOST", "localhost")
+PG_PORT = int(os.getenv("PG_PORT", "5432"))
+PG_USER = os.getenv("PG_USER", "postgres")
+PG_PASSWORD = os.getenv("PG_PASSWORD", "postgres")
+PG_DB = os.getenv("PG_DB", "postgres")
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+
+DDL = """
+CREATE TABLE IF NOT EXISTS orders_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    event_ts TIMESTAMPTZ NOT NULL,
+    order_id TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    amount NUMERIC(10,2) NOT NULL,
+    currency TEXT NOT NULL,
+    items_count INT NOT NULL
+);
+
+-- running totals kept in step with orders_events by UPSERT_SUMMARY_MANY;
+-- one row per (dimension, key, currency), dimension is 'total' (key ''),
+-- 'status', 'event_type' or 'category'
+CREATE TABLE IF NOT EXISTS orders_summary (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    events BIGINT NOT NULL,
+    amount_cents BIGINT NOT NULL,
+    min_cents BIGINT NOT NULL,
+    max_cents BIGINT NOT NULL,
+    PRIMARY KEY (dimension, key, currency)
+);
+"""
+
+# bulk upsert into orders_events (for psycopg2.extras.execute_values) plus
+# the matching orders_summary delta in a single statement: only rows that
+# were really inserted (RETURNING) are counted, so replays and duplicates
+# never count twice. Category is not stored in orders_events
+# and is joined back from the batch. Summary rows are upserted in key order
+# so concurrent writers lock them in the same order.
+UPSERT_SUMMARY_MANY = """
+WITH batch (event_id, event_type, event_ts, order_id, customer_id, status, amount, currency, items_count, category) AS (
+    VALUES %s
+), inserted AS (
+    INSERT INTO orders_events (
+        event_id, event_type, event_ts, order_id, customer_id, status, amount, currency, items_count
+    )
+    SELECT event_id, event_type, event_ts, order_id, customer_id, status, amount, currency, items_count FROM batch
+    ON CONFLICT (event_id) DO NOTHING
+    RETURNING event_id, event_type, status, currency, (amount * 100)::bigint AS cents
+), categories AS (
+    SELECT DISTINCT ON (event_id) event_id, category FROM batch
+), delta AS (
+    SELECT
+        CASE
+            WHEN GROUPING(i.status) = 0 THEN 'status'
+            WHEN GROUPING(i.event_type) = 0 THEN 'event_type'
+            WHEN GROUPING(c.category) = 0 THEN 'category'
+            ELSE 'total'
+        END AS dimension,
+        COALESCE(i.status, i.event_type, c.category, '') AS key,
+        i.currency,
+        count(*) AS events,
+        sum(i.cents)::bigint AS amount_cents,
+        min(i.cents) AS min_cents,
+        max(i.cents) AS max_cents
+    FROM inserted i JOIN categories c USING (event_id)
+    GROUP BY GROUPING SETS ((i.currency), (i.status, i.currency), (i.event_type, i.currency), (c.category, i.currency))
+)
+INSERT INTO orders_summary AS s (dimension, key, currency, events, amount_cents, min_cents, max_cents)
+SELECT dimension, key, currency, events, amount_cents, min_cents, max_cents FROM delta
+ORDER BY dimension, key, currency
+ON CONFLICT (dimension, key, currency) DO UPDATE SET
+    events = s.events + EXCLUDED.events,
+    amount_cents = s.amount_cents + EXCLUDED.amount_cents,
+    min_cents = LEAST(s.min_cents, EXCLUDED.min_cents),
+    max_cents = GREATEST(s.max_cents, EXCLUDED.max_cents);
+"""
+
+UPSERT_SUMMARY_VALUES = "(%(event_id)s, %(event_type)s, %(event_ts)s, %(order_id)s, %(customer_id)s, %(status)s, %(amount)s, %(currency)s, %(items_count)s, %(category)s)"
+
+# true when there is nothing to seed: orders_summary already has rows or
+# orders_events is empty
+SUMMARY_READY = """
+SELECT EXISTS (SELECT 1 FROM orders_summary) OR NOT EXISTS (SELECT 1 FROM orders_events);
+"""
+
+# builds orders_summary from rows written before it existed; those rows have
+# no category, so only the total/status/event_type dimensions are seeded
+SUMMARY_SEED = """
+INSERT INTO orders_summary (dimension, key, currency, events, amount_cents, min_cents, max_cents)
+SELECT
+    CASE
+        WHEN GROUPING(status) = 0 THEN 'status'
+        WHEN GROUPING(event_type) = 0 THEN 'event_type'
+        ELSE 'total'
+    END,
+    COALESCE(status, event_type, ''),
+    currency,
+    count(*),
+    sum((amount * 100)::bigint)::bigint,
+    min((amount * 100)::bigint),
+    max((amount * 100)::bigint)
+FROM orders_events
+WHERE NOT EXISTS (SELECT 1 FROM orders_summary)
+GROUP BY GROUPING SETS ((currency), (status, currency), (event_type, currency));
+"""
+
+SUMMARY_SELECT = """
+SELECT dimension, key, currency, events, amount_cents, min_cents, max_cents FROM orders_summary;
+"""
+
+
+def pg_connect():
+    return psycopg2.connect(
+        host=PG_HOST, port=PG_PORT, user=PG_USER, password=PG_PASSWORD, dbname=PG_DB
+    )
+
+
+def ensure_db(conn) -> None:
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(DDL)
+        cur.execute(SUMMARY_READY)
+        ready = cur.fetchone()[0]
+    if not ready:
+        _seed_summary(conn)
+
+
+def _seed_summary(conn) -> None:
+    # the lock waits for open inserts to commit and keeps new ones out until
+    # the seed is in, so no row is counted twice or missed
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE orders_summary IN SHARE ROW EXCLUSIVE MODE;")
+            cur.execute(SUMMARY_SEED)
+            seeded = cur.rowcount
+        conn.commit()
+        if seeded > 0:
+            logging.info(f"Seeded orders_summary from existing orders_events ({seeded} rows)")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+
+def load_summary(conn, group_by: str | None = None) -> BatchStats:
+    """The --summary figures read from orders_summary (a few dozen rows, whatever the table size)"""
+    stats = BatchStats(group_by)
+    with conn.cursor() as cur:
+        cur.execute(SUMMARY_SELECT)
+        rows = cur.fetchall()
+    for dimension, key, currency, events, cents, lo, hi in rows:
+        if dimension == "total":
+            stats.count += events
+            stats.total_cents += cents
+            stats.min_cents = lo if stats.min_cents is None else min(stats.min_cents, lo)
+            stats.max_cents = hi if stats.max_cents is None else max(stats.max_cents, hi)
+            if group_by == "currency":
+                stats.group_totals[currency] += cents_to_decimal(cents)
+        elif dimension == "status":
+            stats.status_counts[key] += events
+        elif dimension == "event_type":
+            stats.type_counts[key] += events
+        if dimension == group_by:
+            stats.group_totals[key] += cents_to_decimal(cents)
+    return stats
+
+
+def connection_lost(exc: BaseException, conn=None) -> bool:
+    """True when `exc` means the connection is gone (server restart, network drop)"""
+    if isinstance(exc, psycopg2.InterfaceError):
+        return True
+    if isinstance(exc, psycopg2.OperationalError):
+        return conn is None or conn.closed != 0 or isinstance(exc, psycopg2.errors.AdminShutdown)
+    return False
+
+
+def row_rejected(exc: BaseException) -> bool:
+    """True when Postgres refused the data itself (bad value, constraint): retrying the same rows cannot succeed"""
+    return isinstance(exc, (psycopg2.DataError, psycopg2.IntegrityError))
+
+
+class PgPool:
+    """Thread-safe pool of Postgres connections shared by the consumer and the dashboard.
+
+    getconn() hands out an idle connection that still answers SELECT 1, or
+    opens a new one, retrying with exponential backoff (plus jitter) while
+    the server is unreachable. At most `maxconn` connections are out at once;
+    further callers wait for one to be returned.
+    """
+
+    def __init__(self, maxconn: int = PG_POOL_MAX, max_retries: int = 6, backoff_base: float = 0.2, backoff_max: float = 10.0, connect: Callable = pg_connect):
+        self.maxconn = maxconn
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._connect = connect
+        self._idle: list = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.opened = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (0-based): base * 2^attempt, capped, half jittered"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def getconn(self, retries: int | None = None):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._open(self.max_retries if retries is None else retries)
+                if self._healthy(conn):
+                    return conn
+                _close_quietly(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close: bool = False) -> None:
+        """Return `conn`; broken connections and close=True are closed instead of kept"""
+        try:
+            if not close and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            if close or conn.closed:
+                _close_quietly(conn)
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, retries: int | None = None) -> Iterator:
+        conn = self.getconn(retries)
+        try:
+            yield conn
+        except BaseException as exc:
+            self.putconn(conn, close=connection_lost(exc, conn))
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            _close_quietly(conn)
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _open(self, retries: int):
+        attempt = 0
+        while True:
+            try:
+                conn = self._connect()
+                self.opened += 1
+                return conn
+            except psycopg2.OperationalError as e:
+                if attempt >= retries:
+                    raise
+                delay = self.backoff(attempt)
+                logging.warning(f"Postgres connect failed ({str(e).strip()}), retry {attempt + 1}/{retries} in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pool: PgPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PgPool:
+    """The process-wide pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PgPool()
+        return _pool
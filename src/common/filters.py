@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import math
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+import numpy as np
+
+from src.common.columnar import EventBatch
+
+
+class FilterPlan:
+    """Status/currency/amount filters checked on raw input before validation.
+
+    match_bytes() is a cheap pre-check on the undecoded line: an event can only
+    match a status or currency filter if one of the wanted values appears in it
+    as a quoted JSON string. It never rejects a matching event written by our
+    producer (json.dumps does not escape plain ASCII), it may let through a
+    line that mentions the value in another field. match_payload() is the
+    exact check on the decoded dict and decides what is kept.
+    """
+
+    def __init__(self, status_filter: Optional[set[str]] = None, currency_filter: Optional[set[str]] = None, min_amount: Decimal | None = None, max_amount: Decimal | None = None):
+        self.status_filter = frozenset(status_filter) if status_filter else None
+        self.currency_filter = frozenset(currency_filter) if currency_filter else None
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self._status_tokens = tuple(f'"{s}"'.encode("utf-8") for s in sorted(self.status_filter or ()))
+        self._currency_tokens = tuple(f'"{c}"'.encode("utf-8") for c in sorted(self.currency_filter or ()))
+
+    def __bool__(self) -> bool:
+        return bool(self.status_filter or self.currency_filter or self.min_amount is not None or self.max_amount is not None)
+
+    def match_bytes(self, line: bytes) -> bool:
+        if self._status_tokens and not any(t in line for t in self._status_tokens):
+            return False
+        if self._currency_tokens and not any(t in line for t in self._currency_tokens):
+            return False
+        return True
+
+    def match_payload(self, payload: dict) -> bool:
+        if self.status_filter and payload.get("status") not in self.status_filter:
+            return False
+        if self.currency_filter and str(payload.get("currency", "")).upper() not in self.currency_filter:
+            return False
+        if self.min_amount is not None or self.max_amount is not None:
+            try:
+                amt = Decimal(str(payload.get("amount")))
+                if self.min_amount is not None and amt < self.min_amount:
+                    return False
+                if self.max_amount is not None and amt > self.max_amount:
+                    return False
+            except (InvalidOperation, ValueError):
+                # leave it to validation to report the bad amount
+                return True
+        return True
+
+    def mask(self, batch: EventBatch) -> np.ndarray:
+        """Boolean mask of the batch rows that pass every filter"""
+        keep = np.ones(len(batch), dtype=bool)
+        if self.status_filter:
+            keep &= np.isin(batch.status, batch.codes_for("status", self.status_filter))
+        if self.currency_filter:
+            keep &= np.isin(batch.currency, batch.codes_for("currency", self.currency_filter))
+        lo, hi = self.cent_bounds()
+        if lo is not None:
+            keep &= batch.amount_cents >= lo
+        if hi is not None:
+            keep &= batch.amount_cents <= hi
+        return keep
+
+    def cent_bounds(self) -> tuple[int | None, int | None]:
+        """Amount bounds in cents; amounts are whole cents, so round inwards"""
+        lo = math.ceil(self.min_amount * 100) if self.min_amount is not None else None
+        hi = math.floor(self.max_amount * 100) if self.max_amount is not None else None
+        return lo, hi
+
+
+def compile_filters(status_filter: Optional[set[str]] = None, currency_filter: Optional[set[str]] = None, min_amount: Decimal | None = None, max_amount: Decimal | None = None) -> FilterPlan | None:
+    """Build a FilterPlan, or None when no filter is set"""
+    plan = FilterPlan(status_filter, currency_filter, min_amount, max_amount)
+    return plan if plan else None
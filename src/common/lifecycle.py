@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import logging
+import signal
+import threading
+import time
+from typing import Callable
+
+
+class DrainTimeout(TimeoutError):
+    """The shutdown drain did not finish within its time budget"""
+
+
+class ShutdownSignal:
+    """Turns SIGTERM/SIGINT into a flag the streaming loop checks between messages.
+
+    The first signal asks for a graceful drain; a second one raises
+    KeyboardInterrupt to abort it.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason: str | None = None
+        self._previous: dict[int, object] = {}
+
+    def install(self, signals: tuple[int, ...] = (signal.SIGTERM, signal.SIGINT)) -> "ShutdownSignal":
+        # only possible from the main thread
+        for sig in signals:
+            self._previous[sig] = signal.signal(sig, self._handle)
+        return self
+
+    def restore(self) -> None:
+        for sig, handler in self._previous.items():
+            signal.signal(sig, handler)
+        self._previous.clear()
+
+    def request(self, reason: str) -> None:
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    def requested(self) -> bool:
+        return self.event.is_set()
+
+    def _handle(self, signum: int, frame) -> None:
+        name = signal.Signals(signum).name
+        if self.event.is_set():
+            logging.warning(f"Received {name} again, aborting drain")
+            raise KeyboardInterrupt
+        logging.info(f"Received {name}, draining (send again to abort)")
+        self.request(name)
+
+
+class OffsetTracker:
+    """Next offset to commit per partition, for messages the loop is done with.
+
+    Offsets are only committed when the sink has nothing buffered, so a
+    committed offset never runs ahead of what the sink made durable.
+    """
+
+    def __init__(self, source, interval: float = 1.0):
+        self.source = source
+        self.interval = interval
+        self.offsets: dict[int, int] = {}
+        self._dirty = False
+        self._last_commit = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def mark(self, msg) -> None:
+        self.offsets[msg.partition()] = msg.offset() + 1
+        self._dirty = True
+
+    def forget(self, partitions: list[int]) -> None:
+        for p in partitions:
+            self.offsets.pop(p, None)
+
+    def maybe_commit(self, buffered: int) -> None:
+        """Asynchronous commit, at most every `interval` seconds and only when nothing is buffered"""
+        if self._dirty and not buffered and time.monotonic() - self._last_commit >= self.interval:
+            self.commit(asynchronous=True)
+
+    def commit(self, asynchronous: bool = False) -> None:
+        with self._lock:
+            if not self._dirty or self._closed:
+                return
+            self.source.commit_offsets(dict(self.offsets), asynchronous=asynchronous)
+            self._dirty = False
+            self._last_commit = time.monotonic()
+
+    def close(self, timeout: float = 1.0) -> bool:
+        """No commits from now on; waits up to `timeout`s for one in progress, False if it is still running.
+
+        Called when a drain is given up, so its worker thread cannot commit
+        after the source was closed.
+        """
+        self._closed = True
+        if not self._lock.acquire(timeout=timeout):
+            return False
+        self._lock.release()
+        return True
+
+
+def run_bounded(fn: Callable[[], None], timeout: float) -> None:
+    """Run `fn` in a worker thread; raise DrainTimeout if it is still running after `timeout`s.
+
+    Errors from `fn` are re-raised in the caller. A timed out worker is left
+    running as a daemon and dies with the process.
+    """
+    error: list[BaseException] = []
+
+    def target() -> None:
+        try:
+            fn()
+        except BaseException as e:
+            error.append(e)
+
+    worker = threading.Thread(target=target, name="drain", daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        raise DrainTimeout(f"Drain did not finish within {timeout:.1f}s")
+    if error:
+        raise error[0]
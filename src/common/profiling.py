@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import atexit
+import contextlib
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+
+class _Stage:
+    """Counts every entry, times one in `every` of them (CPU and wall clock)"""
+
+    __slots__ = ("name", "every", "calls", "sampled", "cpu_ns", "wall_ns", "_cpu0", "_wall0", "_on")
+
+    def __init__(self, name: str, every: int):
+        self.name = name
+        self.every = every
+        self.calls = 0
+        self.sampled = 0
+        self.cpu_ns = 0
+        self.wall_ns = 0
+        self._cpu0 = 0
+        self._wall0 = 0
+        self._on = False
+
+    def __enter__(self):
+        self.calls += 1
+        if self.calls % self.every == 0:
+            self._on = True
+            self._cpu0 = time.thread_time_ns()
+            self._wall0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self._on:
+            self.cpu_ns += time.thread_time_ns() - self._cpu0
+            self.wall_ns += time.perf_counter_ns() - self._wall0
+            self.sampled += 1
+            self._on = False
+        return False
+
+    def estimate(self) -> tuple[float, float]:
+        """Estimated total (cpu_s, wall_s) scaled up from the samples"""
+        if not self.sampled:
+            return 0.0, 0.0
+        scale = self.calls / self.sampled / 1e9
+        return self.cpu_ns * scale, self.wall_ns * scale
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; stage() costs one method call"""
+
+    _stage = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:
+        return self._stage
+
+    def checkpoint(self) -> None:
+        pass
+
+    def thread(self) -> contextlib.nullcontext:
+        return contextlib.nullcontext()
+
+    def stop(self) -> None:
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """Per-stage CPU sampling, plus an optional cProfile dump and tracemalloc top-N.
+
+    Stage timings are sampled (one in `sample_every` entries is timed), which
+    is cheap enough for a production run. cProfile (`use_cprofile`) and
+    tracemalloc (`trace_alloc`) slow the run down several times and skew the
+    stage numbers, so they are off unless asked for; allocation snapshots are
+    taken at most every `snapshot_interval` seconds. Each thread gets its own
+    stage counters, merged in the report. cProfile sees the thread that
+    called start() and worker threads that run inside thread(). stop()
+    writes `path` (text report) and, with cProfile, `path`.pstats.
+    """
+
+    def __init__(self, path: Path, sample_every: int = 16, top_n: int = 15, use_cprofile: bool = False, trace_alloc: bool = False, snapshot_interval: float = 10.0):
+        self.path = Path(path)
+        self.sample_every = max(1, sample_every)
+        self.top_n = top_n
+        self.trace_alloc = trace_alloc
+        self.snapshot_interval = snapshot_interval
+        self.stages: dict[tuple[str, int], _Stage] = {}
+        self._cprofile = cProfile.Profile() if use_cprofile else None
+        self._thread_profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._started = 0.0
+        self._running = False
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._snapshot_size = 0
+        self._snapshot_ts = float("-inf")
+
+    def stage(self, name: str) -> _Stage:
+        """Counters for `name` in the calling thread; fetch once, reuse in the loop"""
+        key = (name, threading.get_ident())
+        st = self.stages.get(key)
+        if st is None:
+            st = self.stages[key] = _Stage(name, self.sample_every)
+        return st
+
+    def checkpoint(self) -> None:
+        """Keep an allocation snapshot if live memory grew >10% since the last one.
+
+        Call it from places that run every few hundred events; the report then
+        shows what was allocated near the high-water mark instead of at exit.
+        A no-op without `trace_alloc` or within `snapshot_interval` of the
+        previous snapshot.
+        """
+        if not (self._running and self.trace_alloc):
+            return
+        now = time.monotonic()
+        if now - self._snapshot_ts < self.snapshot_interval:
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self._snapshot_size * 1.1:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = current
+            self._snapshot_ts = now
+
+    @contextlib.contextmanager
+    def thread(self):
+        """Wrap the work of a worker thread so cProfile sees it too (merged in the report)"""
+        if not (self._running and self._cprofile):
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+    def start(self) -> "Profiler":
+        self._started = time.perf_counter()
+        if self.trace_alloc:
+            tracemalloc.start(1)
+        if self._cprofile:
+            self._cprofile.enable()
+        self._running = True
+        return self
+
+    def stop(self) -> None:
+        if not self._running:
+            return
+        if self._cprofile:
+            self._cprofile.disable()
+        snapshot, peak = None, 0
+        if self.trace_alloc:
+            self._snapshot_ts = float("-inf")
+            self.checkpoint()
+            snapshot = self._snapshot or tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self._running = False
+        elapsed = time.perf_counter() - self._started
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("w", encoding="utf-8") as f:
+            f.write(self.report(elapsed, snapshot, peak))
+        if self._cprofile:
+            self._cprofile_stats().dump_stats(str(self.path) + ".pstats")
+        logging.info(f"Wrote profile report to {self.path}")
+
+    def report(self, elapsed: float, snapshot: tracemalloc.Snapshot | None, peak: int) -> str:
+        out = io.StringIO()
+        out.write(f"Profile: elapsed={elapsed:.3f}s sample_every={self.sample_every}\n\n")
+
+        out.write("Stages (estimated from samples)\n")
+        out.write(f"{'stage':<12}{'calls':>12}{'cpu_s':>10}{'wall_s':>10}{'cpu_%':>8}{'us/call':>10}\n")
+        merged: dict[str, list] = {}
+        for st in self.stages.values():
+            cpu, wall = st.estimate()
+            row = merged.setdefault(st.name, [0, 0.0, 0.0])
+            row[0] += st.calls
+            row[1] += cpu
+            row[2] += wall
+        cpu_total = sum(row[1] for row in merged.values()) or 1.0
+        for name, (calls, cpu, wall) in sorted(merged.items(), key=lambda kv: -kv[1][1]):
+            per_call = cpu / calls * 1e6 if calls else 0.0
+            out.write(f"{name:<12}{calls:>12}{cpu:>10.3f}{wall:>10.3f}{cpu / cpu_total * 100:>8.1f}{per_call:>10.1f}\n")
+
+        if snapshot is not None:
+            out.write(f"\nAllocations (top {self.top_n} by size at {self._snapshot_size / 1024:.1f} KiB live, peak traced={peak / 1024:.1f} KiB)\n")
+            for stat in snapshot.statistics("lineno")[: self.top_n]:
+                out.write(f"{stat}\n")
+
+        if self._cprofile:
+            out.write(f"\ncProfile (top {self.top_n} by cumulative time)\n")
+            stats = self._cprofile_stats(stream=out)
+            stats.sort_stats("cumulative").print_stats(self.top_n)
+        return out.getvalue()
+
+    def _cprofile_stats(self, stream=None) -> pstats.Stats:
+        stats = pstats.Stats(self._cprofile, stream=stream)
+        for profile in self._thread_profiles:
+            stats.add(profile)
+        return stats
+
+
+def start_profiling(path: str | None, sample_every: int = 16, use_cprofile: bool = False, trace_alloc: bool = False) -> Profiler | NullProfiler:
+    """Start a Profiler that writes its report at exit, or return NULL_PROFILER"""
+    if not path:
+        return NULL_PROFILER
+    prof = Profiler(Path(path), sample_every=sample_every, use_cprofile=use_cprofile, trace_alloc=trace_alloc).start()
+    atexit.register(prof.stop)
+    return prof
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from src.common.filters import FilterPlan
+from src.common.models import OrderEvent
+from src.common.profiling import NULL_PROFILER, Profiler
+from src.common.sinks import Sink, write_dropping_rejected
+from src.common.sources import Source
+
+
+def replay_partition(source: Source, sink: Sink | None, batch_size: int = 1000, filters: FilterPlan | None = None, profiler: Profiler | None = None, stop: threading.Event | None = None) -> tuple[int, int, int]:
+    """Read one bounded partition source to its end, bulk-writing batches.
+
+    Stops early, after writing the current batch, once `stop` is set. Rows
+    the database rejects are dropped and counted as errors, like invalid
+    events. Returns (valid, written, errors).
+    """
+    prof = profiler or NULL_PROFILER
+    stop = stop or threading.Event()
+    st_read, st_filter, st_parse, st_validate, st_sink, st_log = (
+        prof.stage(name) for name in ("read", "filter", "parse", "validate", "sink", "log")
+    )
+    ok, written, err = 0, 0, 0
+    polled = 0
+    batch: list[OrderEvent] = []
+
+    def write(events: list[OrderEvent]) -> None:
+        sink.write_many(events)
+        sink.flush()
+
+    def drop(events: list[OrderEvent], e: Exception) -> None:
+        nonlocal ok, err
+        ok -= 1
+        err += 1
+        with st_log:
+            logging.error(f"[event {events[0].event_id}] rejected by the sink: {str(e).strip()}")
+
+    while not source.exhausted and not (stop and stop.is_set()):
+        with st_read:
+            msg = source.poll(1.0)
+        if msg is None:
+            continue
+        polled += 1
+        if polled % 1000 == 0:
+            prof.checkpoint()
+        if msg.error():
+            logging.error(f"Kafka error on partition {msg.partition()}: {msg.error()}")
+            continue
+        raw = msg.value()
+        if filters:
+            with st_filter:
+                if not filters.match_bytes(raw):
+                    continue
+        try:
+            with st_parse:
+                payload = json.loads(raw)
+            if filters:
+                with st_filter:
+                    if not filters.match_payload(payload):
+                        continue
+            with st_validate:
+                batch.append(OrderEvent(**payload))
+            ok += 1
+        except Exception as e:
+            err += 1
+            with st_log:
+                logging.error(f"[partition {msg.partition()} offset {msg.offset()}] invalid event: {e}")
+        if sink and len(batch) >= batch_size:
+            with st_sink:
+                written += write_dropping_rejected(write, batch, drop)
+            batch = []
+    if sink and batch:
+        with st_sink:
+            written += write_dropping_rejected(write, batch, drop)
+    return ok, written, err
+
+
+def replay(ranges: list[tuple[int, int, int]], open_source: Callable[[int, int, int], Source], open_sink: Callable[[], Sink | None], workers: int | None = None, batch_size: int = 1000, filters: FilterPlan | None = None, profiler: Profiler | None = None, stop: threading.Event | None = None) -> tuple[int, int, int]:
+    """Replay every (partition, start, end) range in parallel.
+
+    Each worker gets its own source and sink (and so its own Postgres
+    connection). Setting `stop` ends the workers after their current batch.
+    On KeyboardInterrupt, or when a worker fails, the other workers are
+    stopped and ranges not started yet are dropped before the error is
+    re-raised. Returns the (valid, written, errors) totals.
+    """
+    ranges = [r for r in ranges if r[2] > r[1]]
+    if not ranges:
+        return 0, 0, 0
+    prof = profiler or NULL_PROFILER
+    stop = stop or threading.Event()
+
+    def run(r: tuple[int, int, int]) -> tuple[int, int, int]:
+        partition, start, end = r
+        source = open_source(partition, start, end)
+        sink = None
+        try:
+            sink = open_sink()
+            with prof.thread():
+                result = replay_partition(source, sink, batch_size=batch_size, filters=filters, profiler=prof, stop=stop)
+            if stop.is_set():
+                logging.warning(f"Stopped replaying partition {partition} early: valid={result[0]} errors={result[2]}")
+            else:
+                logging.info(f"Replayed partition {partition} offsets {start}..{end - 1}: valid={result[0]} errors={result[2]}")
+            return result
+        finally:
+            if sink:
+                sink.close()
+            source.close()
+
+    pool = ThreadPoolExecutor(max_workers=workers or len(ranges))
+    try:
+        results = list(pool.map(run, ranges))
+    except BaseException:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return tuple(sum(col) for col in zip(*results))
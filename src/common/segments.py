@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from src.common.columnar import CURRENCIES, STATUSES, BatchStats, EventBatch, EventBatchBuilder
+from src.common.filters import FilterPlan
+from src.common.sinks import Sink
+
+# Segment file layout (all little-endian):
+#
+#   b"SCSEG001"                      8-byte magic
+#   column data                      each column 8-byte aligned, raw array bytes
+#   footer                           UTF-8 JSON: rows, column directory,
+#                                    category dictionary, per-column min/max,
+#                                    codes present in each enum column
+#   footer length                    uint64
+#   b"SCSEGEND"                      8-byte magic
+#
+# String columns are stored as two arrays: int64 offsets (rows + 1) and the
+# concatenated UTF-8 bytes. Segments are written once and never modified;
+# new data goes into a new segment file.
+MAGIC = b"SCSEG001"
+END_MAGIC = b"SCSEGEND"
+SUFFIX = ".seg"
+
+FIXED_COLUMNS = {
+    "event_ts": "<i8",
+    "amount_cents": "<i8",
+    "items_count": "<i4",
+    "status": "u1",
+    "event_type": "u1",
+    "currency": "u1",
+    "category": "<u2",
+}
+STRING_COLUMNS = ("event_id", "order_id", "customer_id")
+CODED_COLUMNS = ("status", "event_type", "currency", "category")
+
+
+class StringColumn:
+    """Read-only string column over offsets + bytes; rows are decoded on access"""
+
+    __slots__ = ("offsets", "data", "index")
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray, index: np.ndarray | None = None):
+        self.offsets = offsets
+        self.data = data
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1 if self.index is None else len(self.index)
+
+    def __getitem__(self, i: int) -> str:
+        row = i if self.index is None else int(self.index[i])
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+    def take(self, idx: np.ndarray) -> "StringColumn":
+        return StringColumn(self.offsets, self.data, idx if self.index is None else self.index[idx])
+
+
+def _encode_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype="u1")
+
+
+def write_segment(path: Path, batch: EventBatch) -> None:
+    """Write one batch as a segment; the file appears atomically under `path`"""
+    path = Path(path)
+    columns: dict[str, dict] = {}
+    arrays: list[tuple[str, np.ndarray]] = []
+    for name, dtype in FIXED_COLUMNS.items():
+        arrays.append((name, np.ascontiguousarray(getattr(batch, name), dtype=dtype)))
+    for name in STRING_COLUMNS:
+        offsets, data = _encode_strings(getattr(batch, name))
+        arrays.append((f"{name}.offsets", offsets))
+        arrays.append((f"{name}.data", data))
+
+    stats = {}
+    for name in ("event_ts", "amount_cents", "items_count"):
+        col = getattr(batch, name)
+        stats[name] = {"min": int(col.min()), "max": int(col.max())} if len(batch) else None
+    present = {name: np.flatnonzero(np.bincount(getattr(batch, name))).tolist() for name in CODED_COLUMNS}
+
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(MAGIC)
+        pos = len(MAGIC)
+        for name, arr in arrays:
+            pad = -pos % 8
+            f.write(b"\0" * pad)
+            pos += pad
+            f.write(arr.tobytes())
+            columns[name] = {"dtype": arr.dtype.str, "offset": pos, "count": int(arr.size)}
+            pos += arr.nbytes
+        footer = json.dumps({
+            "rows": len(batch),
+            "columns": columns,
+            "categories": list(batch.categories),
+            "stats": stats,
+            "present": present,
+        }).encode("utf-8")
+        f.write(footer)
+        f.write(struct.pack("<Q", len(footer)))
+        f.write(END_MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Segment:
+    """A segment file mapped into memory; columns are zero-copy NumPy views"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._mm)
+        if self._mm[:8] != MAGIC or self._mm[size - 8:] != END_MAGIC:
+            raise ValueError(f"Not a segment file: {self.path}")
+        (footer_len,) = struct.unpack_from("<Q", self._mm, size - 16)
+        self.footer = json.loads(self._mm[size - 16 - footer_len:size - 16])
+        self.rows: int = self.footer["rows"]
+        self.categories: list[str] = self.footer["categories"]
+
+    def column(self, name: str) -> np.ndarray:
+        meta = self.footer["columns"][name]
+        return np.frombuffer(self._mm, dtype=np.dtype(meta["dtype"]), count=meta["count"], offset=meta["offset"])
+
+    def batch(self) -> EventBatch:
+        strings = {name: StringColumn(self.column(f"{name}.offsets"), self.column(f"{name}.data")) for name in STRING_COLUMNS}
+        return EventBatch(
+            strings["event_id"], strings["order_id"], strings["customer_id"],
+            *(self.column(name) for name in FIXED_COLUMNS),
+            self.categories,
+        )
+
+    def may_match(self, filters: FilterPlan | None, from_us: int | None, to_us: int | None) -> bool:
+        """False when the footer proves no row can pass the filters or time range"""
+        if self.rows == 0:
+            return False
+        ts = self.footer["stats"]["event_ts"]
+        if from_us is not None and ts["max"] < from_us:
+            return False
+        if to_us is not None and ts["min"] >= to_us:
+            return False
+        if not filters:
+            return True
+        amt = self.footer["stats"]["amount_cents"]
+        lo, hi = filters.cent_bounds()
+        if lo is not None and amt["max"] < lo:
+            return False
+        if hi is not None and amt["min"] > hi:
+            return False
+        for name, names, wanted in (("status", STATUSES, filters.status_filter), ("currency", CURRENCIES, filters.currency_filter)):
+            if wanted and not {i for i, v in enumerate(names) if v in wanted} & set(self.footer["present"][name]):
+                return False
+        return True
+
+
+class SegmentSink(Sink):
+    """Appends every batch it gets to `directory` as a new segment file.
+
+    Single events from write()/write_many() are buffered and become one
+    segment on flush().
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.written = 0
+        self.segments: list[Path] = []
+        existing = [int(p.stem) for p in list_segments(self.directory)]
+        self._next = max(existing, default=0) + 1
+        self._categories: list[str] = []
+        self._builder = EventBatchBuilder(self._categories)
+
+    def write(self, evt) -> None:
+        self._builder.append(evt)
+
+    def write_batch(self, batch: EventBatch) -> None:
+        if not len(batch):
+            return
+        path = self.directory / f"{self._next:08d}{SUFFIX}"
+        write_segment(path, batch)
+        self._next += 1
+        self.segments.append(path)
+        self.written += len(batch)
+
+    def flush(self) -> None:
+        if len(self._builder):
+            batch = self._builder.build()
+            self._builder = EventBatchBuilder(self._categories)
+            self.write_batch(batch)
+
+    def close(self) -> None:
+        self.flush()
+
+
+def list_segments(directory: Path) -> list[Path]:
+    return sorted(p for p in Path(directory).glob(f"*{SUFFIX}") if p.stem.isdigit())
+
+
+def scan_segments(directory: Path, filters: FilterPlan | None = None, from_us: int | None = None, to_us: int | None = None) -> Iterator[EventBatch]:
+    """Yield the matching rows of every segment, skipping segments by footer stats"""
+    for path in list_segments(directory):
+        seg = Segment(path)
+        if not seg.may_match(filters, from_us, to_us):
+            continue
+        batch = seg.batch()
+        keep = filters.mask(batch) if filters else np.ones(len(batch), dtype=bool)
+        if from_us is not None:
+            keep &= batch.event_ts >= from_us
+        if to_us is not None:
+            keep &= batch.event_ts < to_us
+        yield batch if keep.all() else batch.take(keep)
+
+
+def summarize_segments(directory: Path, filters: FilterPlan | None = None, from_us: int | None = None, to_us: int | None = None, group_by: str | None = None, sink: Sink | None = None) -> BatchStats:
+    """BatchStats over the segments in `directory`, optionally copying rows to `sink`"""
+    stats = BatchStats(group_by)
+    for batch in scan_segments(directory, filters, from_us, to_us):
+        stats.add(batch)
+        if sink:
+            sink.write_batch(batch)
+    return stats
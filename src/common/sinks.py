@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import csv
+import logging
+import time
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable
+
+from psycopg2.extras import execute_values
+
+from src.common.db import UPSERT_SUMMARY_MANY, UPSERT_SUMMARY_VALUES, PgPool, connection_lost, ensure_db, get_pool, row_rejected
+from src.common.batching import BatchController
+from src.common.columnar import EventBatch
+from src.common.models import OrderEvent
+
+
+def _to_db_dict(evt: OrderEvent) -> dict:
+    d = evt.model_dump()
+    if isinstance(d.get("amount"), str):
+        d["amount"] = Decimal(d["amount"])
+    return d
+
+
+def _to_csv_dict(evt: OrderEvent) -> dict:
+    d = evt.model_dump()
+    if isinstance(d.get("amount"), Decimal):
+        d["amount"] = str(d["amount"])
+    return d
+
+
+def write_dropping_rejected(write: Callable[[list | EventBatch], None], rows: list | EventBatch, on_rejected: Callable[[list | EventBatch, Exception], None]) -> int:
+    """Call write(rows); if the database refuses a row (row_rejected), retry in halves.
+
+    Each rejected row ends up alone and is handed to on_rejected instead of
+    being written. `write` must make each call durable on its own (commit),
+    so the halves that went through stay. Returns the number of rows written.
+    """
+    try:
+        write(rows)
+        return len(rows)
+    except Exception as e:
+        if not row_rejected(e):
+            raise
+        if len(rows) == 1:
+            on_rejected(rows, e)
+            return 0
+    mid = len(rows) // 2
+    return write_dropping_rejected(write, rows[:mid], on_rejected) + write_dropping_rejected(write, rows[mid:], on_rejected)
+
+
+class Sink(ABC):
+    """Where validated events end up.
+
+    write() takes one OrderEvent, flush() makes everything written so far
+    durable and close() releases the underlying resources.
+    """
+
+    written: int = 0
+
+    @abstractmethod
+    def write(self, evt: OrderEvent) -> None:
+        ...
+
+    def write_many(self, events: list[OrderEvent]) -> None:
+        for evt in events:
+            self.write(evt)
+
+    def write_batch(self, batch: EventBatch) -> None:
+        self.write_many(batch.to_events())
+
+    def flush(self) -> None:
+        pass
+
+    def maybe_flush(self, backlog: Callable[[], int | None] | None = None) -> None:
+        """Called on every loop iteration so time-based sinks can flush"""
+        pass
+
+    def buffered(self) -> int:
+        """Events accepted by write() but not yet made durable by a flush"""
+        return 0
+
+    def time_to_flush(self) -> float | None:
+        """Seconds until maybe_flush() wants to flush, None if it has no deadline"""
+        return None
+
+    def describe(self) -> str:
+        return ""
+
+    def close(self) -> None:
+        pass
+
+
+class PostgresSink(Sink):
+    """Upserts events into orders_events.
+
+    Each call is one statement that also adds the newly inserted rows to
+    orders_summary, so the summary commits or rolls back with the rows.
+    With autocommit=False every flush() commits one transaction, which is
+    what BatchingSink relies on. Connections come from the shared PgPool:
+    when one is lost mid-transaction the sink takes a fresh one (the pool
+    backs off while Postgres is down), replays the rows written since the
+    last commit and retries. ON CONFLICT DO NOTHING makes the replay safe
+    even if the lost commit had in fact gone through.
+    """
+
+    def __init__(self, conn=None, autocommit: bool = True, pool: PgPool | None = None):
+        # an explicitly passed connection is used as is, without reconnects
+        self.pool = None if conn is not None else (pool or get_pool())
+        self.autocommit = autocommit
+        self.conn = None
+        self.cur = None
+        self.written = 0
+        self.reconnects = 0
+        self._inflight: list[tuple[list, str | None]] = []
+        self._attach(conn if conn is not None else self.pool.getconn())
+
+    def write(self, evt: OrderEvent) -> None:
+        self._insert([_to_db_dict(evt)], UPSERT_SUMMARY_VALUES)
+        self.written += 1
+
+    def write_many(self, events: list[OrderEvent]) -> None:
+        # one multi-row INSERT per call instead of a round trip per event
+        self._insert([_to_db_dict(evt) for evt in events], UPSERT_SUMMARY_VALUES)
+        self.written += len(events)
+
+    def write_batch(self, batch: EventBatch) -> None:
+        # rows are in OrderEvent field order, category last
+        self._insert(list(batch.iter_rows()), None)
+        self.written += len(batch)
+
+    def _insert(self, rows: list, template: str | None) -> None:
+        self._run(lambda: self._execute(rows, template))
+        if not self.autocommit:
+            self._inflight.append((rows, template))
+
+    def flush(self) -> None:
+        if not self.autocommit:
+            self._run(lambda: self.conn.commit())
+            self._inflight.clear()
+
+    def _run(self, op: Callable[[], object]) -> None:
+        """Run `op` on the current connection, reconnecting and replaying the open transaction if it was lost"""
+        attempt = 0
+        while True:
+            try:
+                if self.conn is None:
+                    self._reconnect()
+                op()
+                return
+            except Exception as e:
+                lost = connection_lost(e, self.conn)
+                # self.conn is None when the pool itself gave up reconnecting
+                if not lost or self.pool is None or self.conn is None or attempt >= self.pool.max_retries:
+                    self._abort(lost)
+                    raise
+                logging.warning(f"Postgres connection lost ({str(e).strip()}), reconnecting")
+                self._release(close=True)
+                time.sleep(self.pool.backoff(attempt))
+                attempt += 1
+
+    def _reconnect(self) -> None:
+        self._attach(self.pool.getconn())
+        if self._inflight:
+            logging.info(f"Replaying {sum(len(rows) for rows, _ in self._inflight)} uncommitted rows")
+            for rows, template in self._inflight:
+                self._execute(rows, template)
+        self.reconnects += 1
+
+    def _execute(self, rows: list, template: str | None) -> None:
+        # a single statement per call, so the summary delta is applied once per batch
+        execute_values(self.cur, UPSERT_SUMMARY_MANY, rows, template=template, page_size=max(len(rows), 1))
+
+    def _attach(self, conn) -> None:
+        self.conn = conn
+        ensure_db(conn)
+        conn.autocommit = self.autocommit
+        self.cur = conn.cursor()
+
+    def _abort(self, lost: bool) -> None:
+        # the open transaction is gone either way; callers such as
+        # BatchingSink keep their batch and write it again
+        self._inflight.clear()
+        if lost:
+            if self.pool is not None:
+                self._release(close=True)
+        elif self.conn is not None and not self.autocommit:
+            try:
+                self.conn.rollback()
+            except Exception:
+                self._release(close=True)
+
+    def _release(self, close: bool = False) -> None:
+        conn, self.conn, self.cur = self.conn, None, None
+        if conn is None:
+            return
+        if self.pool is not None:
+            self.pool.putconn(conn, close=close)
+        else:
+            conn.close()
+
+    def close(self) -> None:
+        try:
+            if self.cur is not None:
+                self.cur.close()
+        finally:
+            self._release()
+
+
+class BatchingSink(Sink):
+    """Buffers events and hands them to `sink` in batches sized by a BatchController.
+
+    A batch is flushed when it reaches the controller's batch size or its
+    oldest event has waited longer than the flush interval. If the inner
+    sink fails the batch stays buffered and is retried on the next flush,
+    unless the failure is a row the database refuses (row_rejected): then the
+    batch is split in halves until the bad rows are isolated, and those are
+    logged and dropped so one bad event cannot stall the stream.
+    """
+
+    def __init__(self, sink: Sink, controller: BatchController | None = None):
+        self.sink = sink
+        self.controller = controller or BatchController()
+        self.pending: list[OrderEvent] = []
+        self._first_ts = 0.0
+        self._last_ts = 0.0
+        self.written = 0
+        self.rejected = 0
+
+    def write(self, evt: OrderEvent) -> None:
+        now = time.perf_counter()
+        if not self.pending:
+            self._first_ts = now
+        self._last_ts = now
+        self.pending.append(evt)
+
+    def maybe_flush(self, backlog: Callable[[], int | None] | None = None) -> None:
+        if self.controller.should_flush(len(self.pending), time.perf_counter() - self._first_ts):
+            self._flush(backlog)
+
+    def flush(self) -> None:
+        self._flush(None)
+
+    def _flush(self, backlog: Callable[[], int | None] | None) -> None:
+        if not self.pending:
+            return
+        batch = self.pending
+        start = time.perf_counter()
+        stored = write_dropping_rejected(self._write, batch, self._drop)
+        done = time.perf_counter()
+        self.pending = []
+        self.written += stored
+        self.controller.record_flush(
+            len(batch), done - start, done - self._first_ts, done - self._last_ts,
+            backlog() if backlog else None,
+        )
+
+    def _write(self, events: list[OrderEvent]) -> None:
+        self.sink.write_many(events)
+        self.sink.flush()
+
+    def _drop(self, events: list[OrderEvent], error: Exception) -> None:
+        self.rejected += 1
+        logging.error(f"Dropping event {events[0].event_id} rejected by the sink: {str(error).strip()}")
+
+    def buffered(self) -> int:
+        return len(self.pending)
+
+    def time_to_flush(self) -> float | None:
+        return self.controller.time_to_flush(len(self.pending), time.perf_counter() - self._first_ts)
+
+    def describe(self) -> str:
+        return self.controller.describe()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.sink.close()
+
+
+class CsvSink(Sink):
+    """Writes events to a CSV file; the file is only created once a row arrives"""
+
+    def __init__(self, path: Path = Path("data/validated_orders.csv")):
+        self.path = Path(path)
+        self.written = 0
+        self._f = None
+        self._writer: csv.DictWriter | None = None
+
+    def write(self, evt: OrderEvent) -> None:
+        row = _to_csv_dict(evt)
+        self._open(list(row.keys())).writerow(row)
+        self.written += 1
+
+    def write_batch(self, batch: EventBatch) -> None:
+        if not len(batch):
+            return
+        # iter_rows() is already in OrderEvent field order, same as the header
+        self._open(list(OrderEvent.model_fields)).writer.writerows(batch.iter_rows())
+        self.written += len(batch)
+
+    def _open(self, fieldnames: list[str]) -> csv.DictWriter:
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._f = self.path.open("w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._f, fieldnames=fieldnames)
+            self._writer.writeheader()
+        return self._writer
+
+    def flush(self) -> None:
+        if self._f:
+            self._f.flush()
+
+    def close(self) -> None:
+        if self._f:
+            self._f.close()
+            self._f = None
+
+
+class MemorySink(Sink):
+    """Keeps events in a list (tests and local runs)"""
+
+    def __init__(self):
+        self.events: list[OrderEvent] = []
+        self.flushes = 0
+
+    @property
+    def written(self) -> int:
+        return len(self.events)
+
+    def write(self, evt: OrderEvent) -> None:
+        self.events.append(evt)
+
+    def flush(self) -> None:
+        self.flushes += 1
+
+
+class NullSink(Sink):
+    """Counts and drops events, for measuring the pipeline on its own"""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, evt: OrderEvent) -> None:
+        self.written += 1
+
+    def write_many(self, events: list[OrderEvent]) -> None:
+        self.written += len(events)
+
+    def write_batch(self, batch: EventBatch) -> None:
+        self.written += len(batch)
+
+
+class FanoutSink(Sink):
+    """Writes every event to each of the given sinks"""
+
+    def __init__(self, sinks: list[Sink]):
+        self.sinks = sinks
+
+    @property
+    def written(self) -> int:
+        return max((s.written for s in self.sinks), default=0)
+
+    def write(self, evt: OrderEvent) -> None:
+        for s in self.sinks:
+            s.write(evt)
+
+    def write_many(self, events: list[OrderEvent]) -> None:
+        for s in self.sinks:
+            s.write_many(events)
+
+    def write_batch(self, batch: EventBatch) -> None:
+        for s in self.sinks:
+            s.write_batch(batch)
+
+    def maybe_flush(self, backlog: Callable[[], int | None] | None = None) -> None:
+        for s in self.sinks:
+            s.maybe_flush(backlog)
+
+    def buffered(self) -> int:
+        return max((s.buffered() for s in self.sinks), default=0)
+
+    def time_to_flush(self) -> float | None:
+        return min((t for t in (s.time_to_flush() for s in self.sinks) if t is not None), default=None)
+
+    def describe(self) -> str:
+        return " ".join(d for d in (s.describe() for s in self.sinks) if d)
+
+    def flush(self) -> None:
+        for s in self.sinks:
+            s.flush()
+
+    def close(self) -> None:
+        for s in self.sinks:
+            s.close()
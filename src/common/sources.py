@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import time
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Optional
+
+from confluent_kafka import Consumer as KafkaConsumer
+from confluent_kafka import KafkaError, TopicPartition
+
+BOOTSTRAP_SERVERS = "localhost:9092"
+
+
+class Message:
+    """Minimal stand-in for confluent_kafka.Message used by non-Kafka sources"""
+
+    __slots__ = ("_topic", "_partition", "_offset", "_value", "_timestamp")
+
+    def __init__(self, topic: str, partition: int, offset: int, value: bytes, timestamp: int = 0):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._value = value
+        self._timestamp = timestamp
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def value(self) -> bytes:
+        return self._value
+
+    def timestamp(self) -> tuple[int, int]:
+        # (TIMESTAMP_CREATE_TIME, ms) like confluent_kafka
+        return (1, self._timestamp)
+
+    def error(self):
+        return None
+
+
+class Source(ABC):
+    """Where the consumer reads raw event bytes from.
+
+    poll() follows the confluent_kafka.Consumer contract: it returns a message
+    (with value(), error(), partition(), offset()) or None when nothing is ready.
+    Finite sources set `exhausted` once every message has been handed out.
+    """
+
+    topic: str = ""
+    exhausted: bool = False
+    # set by the consumer loop; called with the partition numbers right
+    # before a rebalance takes them away (on_revoke) or after they were
+    # already lost to another member (on_lost)
+    on_revoke: Callable[[list[int]], None] | None = None
+    on_lost: Callable[[list[int]], None] | None = None
+
+    @abstractmethod
+    def poll(self, timeout: float = 1.0):
+        ...
+
+    def commit(self, message=None, asynchronous: bool = False) -> None:
+        pass
+
+    def commit_offsets(self, offsets: dict[int, int], asynchronous: bool = False) -> None:
+        """Commit `offsets` (partition → next offset to read) for this source's topic"""
+        pass
+
+    def lag(self) -> int | None:
+        """Messages waiting behind the current position, None if unknown"""
+        return None
+
+    def seek(self, partition: int, offset: int) -> None:
+        """Make the next poll() of `partition` return `offset` again"""
+        raise NotImplementedError(f"{type(self).__name__} cannot re-read messages")
+
+    def close(self) -> None:
+        pass
+
+
+class KafkaSource(Source):
+    """Kafka/Redpanda topic consumed through a consumer group.
+
+    Auto commit is off: offsets are committed by the consumer loop once the
+    sink has flushed the events before them.
+    """
+
+    def __init__(self, topic: str, group_id: str, bootstrap_servers: str = BOOTSTRAP_SERVERS, auto_offset_reset: str = "earliest"):
+        self.topic = topic
+        self.consumer = KafkaConsumer({
+            "bootstrap.servers": bootstrap_servers,
+            "group.id": group_id,
+            "auto.offset.reset": auto_offset_reset,
+            "enable.auto.commit": False,
+        })
+        self.consumer.subscribe([topic], on_revoke=self._revoked, on_lost=self._lost)
+
+    def _revoked(self, consumer, partitions) -> None:
+        # runs inside poll(), before the partitions go to another member
+        if self.on_revoke:
+            self.on_revoke([tp.partition for tp in partitions])
+
+    def _lost(self, consumer, partitions) -> None:
+        if self.on_lost:
+            self.on_lost([tp.partition for tp in partitions])
+
+    def poll(self, timeout: float = 1.0):
+        return self.consumer.poll(timeout)
+
+    def commit(self, message=None, asynchronous: bool = False) -> None:
+        if message is not None:
+            self.consumer.commit(message=message, asynchronous=asynchronous)
+        else:
+            self.consumer.commit(asynchronous=asynchronous)
+
+    def commit_offsets(self, offsets: dict[int, int], asynchronous: bool = False) -> None:
+        if offsets:
+            self.consumer.commit(
+                offsets=[TopicPartition(self.topic, p, off) for p, off in offsets.items()],
+                asynchronous=asynchronous,
+            )
+
+    def seek(self, partition: int, offset: int) -> None:
+        # also drops the messages already fetched for the partition
+        self.consumer.seek(TopicPartition(self.topic, partition, offset))
+
+    def lag(self) -> int | None:
+        # cached watermarks come with fetch responses, no broker round trip
+        try:
+            total = 0
+            for tp in self.consumer.position(self.consumer.assignment()):
+                low, high = self.consumer.get_watermark_offsets(tp, cached=True)
+                if tp.offset >= 0 and high >= 0:
+                    total += max(0, high - tp.offset)
+            return total
+        except Exception:
+            return None
+
+    def close(self) -> None:
+        self.consumer.close()
+
+
+class KafkaPartitionSource(Source):
+    """One partition read through assign() between two offsets, end exclusive.
+
+    Nothing is committed and no group is joined, so a replay never moves the
+    live consumer group's offsets. The end is also detected when the offset
+    before it never arrives as a message (transaction markers, compaction):
+    on partition EOF or once the consumer's position has passed it.
+    """
+
+    def __init__(self, topic: str, partition: int, start: int, end: int, group_id: str, bootstrap_servers: str = BOOTSTRAP_SERVERS):
+        self.topic = topic
+        self.partition = partition
+        self.end = end
+        self.exhausted = start >= end
+        self.consumer = KafkaConsumer({
+            "bootstrap.servers": bootstrap_servers,
+            "group.id": group_id,
+            "enable.auto.commit": False,
+            "enable.partition.eof": True,
+            # `start` may already be gone to retention: resume at the oldest record left
+            "auto.offset.reset": "earliest",
+        })
+        self.consumer.assign([TopicPartition(topic, partition, start)])
+
+    def poll(self, timeout: float = 1.0):
+        if self.exhausted:
+            return None
+        msg = self.consumer.poll(timeout)
+        if msg is None:
+            self._check_position()
+            return None
+        if msg.error():
+            if msg.error().code() == KafkaError._PARTITION_EOF:
+                self.exhausted = True
+                return None
+            return msg
+        if msg.offset() >= self.end - 1:
+            self.exhausted = True
+        if msg.offset() >= self.end:
+            return None
+        return msg
+
+    def _check_position(self) -> None:
+        position = self.consumer.position([TopicPartition(self.topic, self.partition)])[0].offset
+        if position >= self.end:
+            self.exhausted = True
+
+    def close(self) -> None:
+        self.consumer.close()
+
+
+def _partition_range(start: int, end: int, low: int, high: int) -> tuple[int, int]:
+    # offsets_for_times() answers -1 when no message is at/after the timestamp
+    start = high if start < 0 else max(start, low)
+    end = high if end < 0 else min(end, high)
+    return start, max(start, end)
+
+
+def kafka_partition_ranges(topic: str, from_ms: int | None, to_ms: int | None, bootstrap_servers: str = BOOTSTRAP_SERVERS, timeout: float = 10.0) -> list[tuple[int, int, int]]:
+    """Resolve [from_ms, to_ms) to (partition, start, end) offsets per partition"""
+    consumer = KafkaConsumer({
+        "bootstrap.servers": bootstrap_servers,
+        "group.id": "streamcart-offset-lookup",
+        "enable.auto.commit": False,
+    })
+    try:
+        md = consumer.list_topics(topic, timeout=timeout)
+        partitions = sorted(md.topics[topic].partitions)
+        watermarks = {p: consumer.get_watermark_offsets(TopicPartition(topic, p), timeout=timeout) for p in partitions}
+        starts = {p: watermarks[p][0] for p in partitions}
+        ends = {p: -1 for p in partitions}
+        if from_ms is not None:
+            for tp in consumer.offsets_for_times([TopicPartition(topic, p, from_ms) for p in partitions], timeout=timeout):
+                starts[tp.partition] = tp.offset
+        if to_ms is not None:
+            for tp in consumer.offsets_for_times([TopicPartition(topic, p, to_ms) for p in partitions], timeout=timeout):
+                ends[tp.partition] = tp.offset
+    finally:
+        consumer.close()
+    return [(p, *_partition_range(starts[p], ends[p], *watermarks[p])) for p in partitions]
+
+
+class FileSource(Source):
+    """JSONL file read line by line; the offset is the 0-based line index"""
+
+    def __init__(self, path: Path, topic: str = "file"):
+        self.path = Path(path)
+        self.topic = topic
+        self._f = self.path.open("rb")
+        self._offset = 0
+
+    def poll(self, timeout: float = 1.0):
+        if self.exhausted:
+            return None
+        line = self._f.readline()
+        if not line:
+            self.exhausted = True
+            return None
+        msg = Message(self.topic, 0, self._offset, line)
+        self._offset += 1
+        return msg
+
+    def seek(self, partition: int, offset: int) -> None:
+        # lines have no index: read forward from the start of the file
+        self._f.seek(0)
+        for _ in range(offset):
+            self._f.readline()
+        self._offset = offset
+        self.exhausted = False
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class MemoryBroker:
+    """In-process broker with partitioned topics, offsets and committed group offsets.
+
+    Good enough to drive the consumer without Redpanda: messages are keyed to a
+    partition (crc32 of the key, round-robin without one), keep their produce
+    timestamp and are never deleted.
+    """
+
+    def __init__(self, partitions: int = 1):
+        self.default_partitions = partitions
+        self.topics: dict[str, list[list[Message]]] = {}
+        self.committed: dict[tuple[str, str, int], int] = {}
+        self._rr: dict[str, int] = {}
+
+    def create_topic(self, topic: str, partitions: int | None = None) -> None:
+        if topic not in self.topics:
+            self.topics[topic] = [[] for _ in range(partitions or self.default_partitions)]
+
+    def partitions(self, topic: str) -> int:
+        self.create_topic(topic)
+        return len(self.topics[topic])
+
+    def produce(self, topic: str, value: bytes, key: bytes | None = None, partition: int | None = None, timestamp: int | None = None) -> Message:
+        self.create_topic(topic)
+        parts = self.topics[topic]
+        if partition is None:
+            if key is not None:
+                partition = zlib.crc32(key) % len(parts)
+            else:
+                partition = self._rr.get(topic, 0) % len(parts)
+                self._rr[topic] = partition + 1
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        log = parts[partition]
+        msg = Message(topic, partition, len(log), value, timestamp)
+        log.append(msg)
+        return msg
+
+    def watermark_offsets(self, topic: str, partition: int) -> tuple[int, int]:
+        self.create_topic(topic)
+        return 0, len(self.topics[topic][partition])
+
+    def offsets_for_times(self, topic: str, partition: int, timestamp: int) -> int:
+        """First offset with a timestamp >= `timestamp`, or -1 like Kafka"""
+        for msg in self.topics[topic][partition]:
+            if msg._timestamp >= timestamp:
+                return msg.offset()
+        return -1
+
+    def partition_ranges(self, topic: str, from_ms: int | None, to_ms: int | None) -> list[tuple[int, int, int]]:
+        """Same contract as kafka_partition_ranges()"""
+        ranges = []
+        for p in range(self.partitions(topic)):
+            low, high = self.watermark_offsets(topic, p)
+            start = low if from_ms is None else self.offsets_for_times(topic, p, from_ms)
+            end = -1 if to_ms is None else self.offsets_for_times(topic, p, to_ms)
+            ranges.append((p, *_partition_range(start, end, low, high)))
+        return ranges
+
+    def committed_offset(self, group_id: str, topic: str, partition: int) -> Optional[int]:
+        return self.committed.get((group_id, topic, partition))
+
+    def commit(self, group_id: str, topic: str, partition: int, offset: int) -> None:
+        self.committed[(group_id, topic, partition)] = offset
+
+
+class MemorySource(Source):
+    """Consumer-group view over a MemoryBroker topic.
+
+    Resumes from the group's committed offsets (or auto_offset_reset), reads
+    partitions round-robin and, like Kafka's enable.auto.commit, commits the
+    consumed position as it goes unless auto_commit=False.
+    """
+
+    def __init__(self, broker: MemoryBroker, topic: str, group_id: str, auto_offset_reset: str = "earliest", auto_commit: bool = True, stop_at_end: bool = True):
+        self.broker = broker
+        self.topic = topic
+        self.group_id = group_id
+        self.auto_commit = auto_commit
+        self.stop_at_end = stop_at_end
+        self.positions: dict[int, int] = {}
+        for p in range(broker.partitions(topic)):
+            committed = broker.committed_offset(group_id, topic, p)
+            if committed is None:
+                low, high = broker.watermark_offsets(topic, p)
+                committed = low if auto_offset_reset == "earliest" else high
+            self.positions[p] = committed
+        self._next = 0
+
+    def poll(self, timeout: float = 1.0):
+        logs = self.broker.topics[self.topic]
+        n = len(logs)
+        for step in range(n):
+            p = (self._next + step) % n
+            pos = self.positions[p]
+            if pos < len(logs[p]):
+                msg = logs[p][pos]
+                self.positions[p] = pos + 1
+                self._next = p + 1
+                if self.auto_commit:
+                    self.broker.commit(self.group_id, self.topic, p, pos + 1)
+                return msg
+        if self.stop_at_end:
+            self.exhausted = True
+        return None
+
+    def lag(self) -> int | None:
+        logs = self.broker.topics[self.topic]
+        return sum(len(logs[p]) - pos for p, pos in self.positions.items())
+
+    def seek(self, partition: int, offset: int) -> None:
+        self.positions[partition] = offset
+        self.exhausted = False
+
+    def commit(self, message=None, asynchronous: bool = False) -> None:
+        if message is not None:
+            self.broker.commit(self.group_id, message.topic(), message.partition(), message.offset() + 1)
+            return
+        for p, pos in self.positions.items():
+            self.broker.commit(self.group_id, self.topic, p, pos)
+
+    def commit_offsets(self, offsets: dict[int, int], asynchronous: bool = False) -> None:
+        for p, off in offsets.items():
+            self.broker.commit(self.group_id, self.topic, p, off)
+
+
+class MemoryPartitionSource(Source):
+    """MemoryBroker counterpart of KafkaPartitionSource"""
+
+    def __init__(self, broker: MemoryBroker, topic: str, partition: int, start: int, end: int):
+        self.topic = topic
+        self.partition = partition
+        self._log = broker.topics[topic][partition]
+        self._pos = start
+        self.end = end
+        self.exhausted = start >= end
+
+    def poll(self, timeout: float = 1.0):
+        if self._pos >= self.end:
+            self.exhausted = True
+            return None
+        msg = self._log[self._pos]
+        self._pos += 1
+        return msg
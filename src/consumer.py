@@ -2,19 +2,33 @@ from __future__ import annotations
 
 import argparse
 import json
-import os
 from pathlib import Path
 from decimal import Decimal
 import sys 
-import psycopg2
 import csv
 import logging
+import math
 import time
+from datetime import datetime, timezone
+
+import numpy as np
 
 from src.common.models import OrderEvent
+from src.common.db import PG_HOST, PG_PORT, PG_USER, PG_DB, DDL, ensure_db, get_pool, load_summary, row_rejected
+from src.common.batching import BatchController
+from src.common.columnar import ENCODED, BatchStats, EventBatch, EventBatchBuilder, cents_to_decimal, to_cents, to_micros
+from src.common.sinks import Sink, BatchingSink, PostgresSink, CsvSink, MemorySink, NullSink, FanoutSink, write_dropping_rejected
+from src.common.filters import FilterPlan, compile_filters
+from src.common.lifecycle import DrainTimeout, OffsetTracker, ShutdownSignal, run_bounded
+from src.common.profiling import NULL_PROFILER, Profiler, start_profiling
+from src.common.replay import replay
+from src.common.segments import SegmentSink, scan_segments, summarize_segments
+from src.common.sources import (
+    Source, KafkaSource, KafkaPartitionSource, FileSource, MemoryBroker, MemorySource, MemoryPartitionSource,
+    kafka_partition_ranges, BOOTSTRAP_SERVERS,
+)
 from collections import Counter
 from typing import Optional
-from confluent_kafka import Consumer as KafkaConsumer
 from confluent_kafka.admin import AdminClient
 
 logging.basicConfig(
@@ -22,164 +36,461 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 
-# Postgres Configuration
-PG_HOST = os.getenv("PG_HOST", "localhost")
-PG_PORT = int(os.getenv("PG_PORT", "5432"))
-PG_USER = os.getenv("PG_USER", "postgres")
-PG_PASSWORD = os.getenv("PG_PASSWORD", "postgres")
-PG_DB = os.getenv("PG_DB", "postgres")
-
-DDL = """
-CREATE TABLE IF NOT EXISTS orders_events (
-    event_id TEXT PRIMARY KEY,
-    event_type TEXT NOT NULL,
-    event_ts TIMESTAMPTZ NOT NULL,
-    order_id TEXT NOT NULL,
-    customer_id TEXT NOT NULL,
-    status TEXT NOT NULL,
-    amount NUMERIC(10,2) NOT NULL,
-    currency TEXT NOT NULL,
-    items_count INT NOT NULL
-);
-"""
-
-UPSERT = """
-INSERT INTO orders_events (
-    event_id, event_type, event_ts, order_id, customer_id, status, amount, currency, items_count
-) VALUES (
-    %(event_id)s, %(event_type)s, %(event_ts)s, %(order_id)s, %(customer_id)s, %(status)s, %(amount)s, %(currency)s, %(items_count)s
-)
-ON CONFLICT (event_id) DO NOTHING;
-"""
-
-
-def pg_connect():
-    return psycopg2.connect(
-        host=PG_HOST, port=PG_PORT, user=PG_USER, password=PG_PASSWORD, dbname=PG_DB
-    )
-
-
-def ensure_db(conn) -> None:
-    conn.autocommit = True
-    with conn.cursor() as cur:
-        cur.execute(DDL)
-
 
 def validate_event(payload: dict) -> OrderEvent:
     return OrderEvent(**payload)
 
 
-def _to_db_dict(evt: OrderEvent) -> dict:
-    d = evt.model_dump()
-    if isinstance(d.get("amount"), str):
-        d["amount"] = Decimal(d["amount"])
-    return d
-
-from collections import defaultdict
-group_totals: dict[str, Decimal] = defaultdict(Decimal)
-
-def validate_file(path: Path, to_postgres: bool = False, to_csv: bool = False, group_by: str | None = None, status_filter: Optional[set[str]] = None, currency_filter: Optional[set[str]] = None, limit: int | None = None,check_duplicates: bool = False,min_amount: Decimal | None = None,
-    max_amount: Decimal | None = None,) -> tuple[int, int, Decimal, Counter, Counter,int | None, int | None, int]:
-    """Validate all JSONL events"""
+def validate_file(path: Path | None, to_postgres: bool = False, to_csv: bool = False, group_by: str | None = None, status_filter: Optional[set[str]] = None, currency_filter: Optional[set[str]] = None, limit: int | None = None,check_duplicates: bool = False,min_amount: Decimal | None = None,
+    max_amount: Decimal | None = None, source: Source | None = None, sink: Sink | None = None, filters: FilterPlan | None = None, profiler: Profiler | None = None, batch_size: int = 8192, to_segments: Path | None = None,
+    from_ts: datetime | None = None, to_ts: datetime | None = None) -> tuple[int, int, Decimal, Counter, Counter,int | None, int | None, int]:
+    """Validate all JSONL events.
+
+    Reads from `source` (a FileSource over `path` by default) and writes valid
+    events to `sink` (built from to_postgres/to_csv by default). A sink passed
+    in by the caller is flushed but left open.
+
+    The status/currency/amount filters (or a precompiled `filters` plan) run
+    on the raw line and payload before validation; events they reject are not
+    validated, counted, aggregated or written anywhere. Valid events outside
+    the [from_ts, to_ts) event_ts window are skipped the same way.
+
+    Valid events are collected into columnar EventBatches of `batch_size`
+    rows; stats are computed per batch with NumPy and each batch goes to the
+    sink in one call. With `to_segments` each batch is also appended to that
+    directory as a columnar segment file.
+    """
+    plan = filters or compile_filters(status_filter, currency_filter, min_amount, max_amount)
+    prof = profiler or NULL_PROFILER
+    st_read, st_filter, st_parse, st_validate, st_aggregate, st_sink, st_log = (
+        prof.stage(name) for name in ("read", "filter", "parse", "validate", "aggregate", "sink", "log")
+    )
+    from_us = to_micros(from_ts) if from_ts else None
+    to_us = to_micros(to_ts) if to_ts else None
     ok, err = 0, 0
-    total = Decimal("0")
-    status_counts = Counter()
-    type_counts = Counter()
-    rows: list[dict] = []
-    conn = None
-    cur = None
-    min_amt: Decimal | None = None
-    max_amt: Decimal | None = None
+    stats = BatchStats(group_by)
+    categories: list[str] = []
+    builder = EventBatchBuilder(categories)
     seen_ids: set[str] = set()
     duplicates: int = 0
+    own_source = source is None
+    own_sink = sink is None
+
+    def consume(batch: EventBatch) -> None:
+        nonlocal ok, err
+        if sink:
+            rejected: set[str] = set()
+
+            def drop(row: EventBatch, e: Exception) -> None:
+                rejected.add(row.event_id[0])
+                with st_log:
+                    logging.error(f"[event {row.event_id[0]}] rejected by the sink: {str(e).strip()}")
+
+            # our PostgresSink autocommits, so the halves that went through stay
+            with st_sink:
+                write_dropping_rejected(sink.write_batch, batch, drop)
+            if rejected:
+                # counted as errors, like lines that failed validation
+                kept = batch.take(np.array([eid not in rejected for eid in batch.event_id], dtype=bool))
+                ok -= len(batch) - len(kept)
+                err += len(batch) - len(kept)
+                batch = kept
+        with st_aggregate:
+            stats.add(batch)
 
+    try:
+        if own_source:
+            source = FileSource(path)
+        if own_sink:
+            sinks: list[Sink] = []
+            if to_postgres:
+                sinks.append(PostgresSink())
+            if to_csv:
+                sinks.append(CsvSink(Path("data/validated_orders.csv")))
+            if to_segments:
+                sinks.append(SegmentSink(to_segments))
+            if sinks:
+                sink = sinks[0] if len(sinks) == 1 else FanoutSink(sinks)
+
+        i = 0
+        while True:
+            if limit and ok >= limit:
+                break
+            with st_read:
+                msg = source.poll(0)
+            if msg is None:
+                if source.exhausted:
+                    break
+                continue
+            i += 1
+            if i % 100 == 0:
+                with st_log:
+                    logging.info(f"Processed {i} lines so far → valid: {ok}, errors: {err}")
+                prof.checkpoint()
+            line = msg.value().strip()
+            if not line:
+                continue
+            if plan:
+                with st_filter:
+                    if not plan.match_bytes(line):
+                        continue
+            try:
+                with st_parse:
+                    payload = json.loads(line)
+                if plan:
+                    with st_filter:
+                        if not plan.match_payload(payload):
+                            continue
+                with st_validate:
+                    evt = validate_event(payload)
+                if from_us is not None or to_us is not None:
+                    with st_filter:
+                        ts = to_micros(evt.event_ts)
+                        if (from_us is not None and ts < from_us) or (to_us is not None and ts >= to_us):
+                            continue
+                with st_aggregate:
+                    # raises for values the columnar batch cannot hold
+                    builder.append(evt)
+            except Exception as e:
+                err += 1
+                with st_log:
+                    logging.error(f"[line {i}] invalid event: {e}")
+                continue
+            ok += 1
+            if check_duplicates:
+                with st_aggregate:
+                    if evt.event_id in seen_ids:
+                        duplicates += 1
+                        logging.warning(f"Duplicate event_id found: {evt.event_id} (line {i})")
+                    else:
+                        seen_ids.add(evt.event_id)
+            if len(builder) >= batch_size:
+                consume(builder.build())
+                builder = EventBatchBuilder(categories)
+
+        consume(builder.build())
+        if sink:
+            with st_sink:
+                sink.flush()
+    finally:
+        if own_sink and sink:
+            sink.close()
+        if own_source and source:
+            source.close()
+
+    return ok, err, stats.total, stats.status_counts, stats.type_counts, stats.min_amount, stats.max_amount, duplicates, stats.group_totals
+
+
+def validate_segments(directory: Path, to_postgres: bool = False, to_csv: bool = False, group_by: str | None = None, filters: FilterPlan | None = None, from_ts: datetime | None = None, to_ts: datetime | None = None, profiler: Profiler | None = None) -> tuple[int, int, Decimal, Counter, Counter, Decimal | None, Decimal | None, int, dict]:
+    """validate_file() over columnar segments instead of JSONL.
+
+    Segments hold already validated events, so errors and duplicates are 0.
+    Whole segments are skipped when their footer stats rule out the filters
+    or the [from_ts, to_ts) range.
+    """
+    prof = profiler or NULL_PROFILER
+    sinks: list[Sink] = []
+    sink = None
     try:
         if to_postgres:
-            conn = pg_connect()
-            ensure_db(conn)
-            cur = conn.cursor()
+            sinks.append(PostgresSink())
+        if to_csv:
+            sinks.append(CsvSink(Path("data/validated_orders.csv")))
+        if sinks:
+            sink = sinks[0] if len(sinks) == 1 else FanoutSink(sinks)
+        with prof.stage("aggregate"):
+            stats = summarize_segments(
+                directory, filters,
+                to_micros(from_ts) if from_ts else None, to_micros(to_ts) if to_ts else None,
+                group_by=group_by, sink=sink,
+            )
+        if sink:
+            sink.flush()
+    finally:
+        if sink:
+            sink.close()
+    return stats.count, 0, stats.total, stats.status_counts, stats.type_counts, stats.min_amount, stats.max_amount, 0, stats.group_totals
+
+
+def summarize_postgres(group_by: str | None = None) -> tuple[int, int, Decimal, Counter, Counter, Decimal | None, Decimal | None, int, dict]:
+    """validate_file()'s results for everything in orders_events, read from orders_summary.
+
+    Events rejected before insert are not in Postgres, so errors and
+    duplicates are 0.
+    """
+    with get_pool().connection() as conn:
+        ensure_db(conn)
+        stats = load_summary(conn, group_by)
+    return stats.count, 0, stats.total, stats.status_counts, stats.type_counts, stats.min_amount, stats.max_amount, 0, stats.group_totals
+
+
+def stream_events(source: Source, sink: Sink | None = None, limit: int | None = None, print_events: bool = False, metrics_every: int = 100, filters: FilterPlan | None = None, profiler: Profiler | None = None, shutdown: ShutdownSignal | None = None, drain_timeout: float = 25.0, commit_interval: float = 1.0, retry_max: float = 5.0) -> tuple[int, int]:
+    """Validate events from a streaming source and write them to the sink.
+
+    Runs until `limit` events were consumed, the source is exhausted or
+    `shutdown` is requested (SIGTERM/SIGINT). Events rejected by `filters`
+    are dropped before validation and do not count towards `limit`.
+
+    Source offsets are committed only when the sink has nothing buffered, so
+    they never run ahead of what the sink made durable. Before partitions are
+    revoked, and on the way out, the sink is flushed and offsets committed
+    synchronously; the final drain raises DrainTimeout if it takes longer
+    than `drain_timeout` seconds. If the sink fails on an event, the source
+    seeks back to it and it is retried after a backoff (up to `retry_max`
+    seconds), so nothing after it is committed until it went through;
+    events the sink rejects outright are dropped like invalid ones. A KeyboardInterrupt (a second signal) stops
+    without draining and is re-raised. Returns (consumed, written).
+    """
+    count = 0
+    inserted = 0
+    filtered = 0
+    failures = 0
+    prof = profiler or NULL_PROFILER
+    offsets = OffsetTracker(source, interval=commit_interval)
+
+    def checkpoint() -> None:
+        if sink:
+            sink.flush()
+        offsets.commit()
+
+    def revoke(partitions: list[int]) -> None:
+        logging.info(f"Partitions {partitions} revoked, flushing and committing before hand-over")
+        try:
+            checkpoint()
+        except Exception as e:
+            logging.error(f"Checkpoint before revoke failed, the new owner will re-read uncommitted events: {e}")
+        offsets.forget(partitions)
+
+    def lost(partitions: list[int]) -> None:
+        # already owned by someone else: committing now could move their offsets
+        logging.warning(f"Partitions {partitions} lost, dropping their uncommitted offsets")
+        offsets.forget(partitions)
+
+    source.on_revoke = revoke
+    source.on_lost = lost
+    st_read, st_filter, st_parse, st_validate, st_sink, st_log = (
+        prof.stage(name) for name in ("read", "filter", "parse", "validate", "sink", "log")
+    )
 
-        with path.open("r", encoding="utf-8") as f:
-            for i, line in enumerate(f, start=1):
-                if limit and ok >= limit:
-                    break
-                line = line.strip()
-                if not line:
-                    continue
+    # Performance metrics 
+    start_ts = time.perf_counter()
+    last_report_ts = start_ts
+    last_report_count = 0
+    report_every = metrics_every
+
+    try:
+        while not (shutdown and shutdown.requested()):
+            # wake up in time for the sink's flush deadline, not a whole second later
+            due = sink.time_to_flush() if sink else None
+            with st_read:
+                msg = source.poll(1.0 if due is None else min(1.0, due))
+            if sink:
                 try:
-                    payload = json.loads(line)
+                    with st_sink:
+                        sink.maybe_flush(source.lag)
+                except Exception as e:
+                    logging.error(f"Sink flush failed: {e}")
+            try:
+                offsets.maybe_commit(sink.buffered() if sink else 0)
+            except Exception as e:
+                logging.error(f"Offset commit failed: {e}")
+            if msg is None:
+                if source.exhausted:
+                    break
+                continue
+            if msg.error():
+                logging.error(f"Kafka error: {msg.error()}")
+                continue
+
+            # a message is marked once it is done with: filtered out, invalid or
+            # handed to the sink; never before the sink took it
+            raw = msg.value()
+            if filters:
+                with st_filter:
+                    if not filters.match_bytes(raw):
+                        filtered += 1
+                        offsets.mark(msg)
+                        continue
+            try:
+                with st_parse:
+                    payload = json.loads(raw)
+                if filters:
+                    with st_filter:
+                        if not filters.match_payload(payload):
+                            filtered += 1
+                            offsets.mark(msg)
+                            continue
+                with st_validate:
                     evt = validate_event(payload)
-                    if check_duplicates:
-                        if evt.event_id in seen_ids:
-                            duplicates += 1
-                            logging.warning(f"Duplicate event_id found: {evt.event_id} (line {i})")
+            except Exception as e:
+                logging.error(f"Invalid event from {source.topic}: {e}")
+                offsets.mark(msg)
+                continue
+
+            if sink:
+                try:
+                    with st_sink:
+                        sink.write(evt)
+                    inserted += 1
+                    failures = 0
+                    offsets.mark(msg)
+                except Exception as e:
+                    if row_rejected(e) or isinstance(e, ValueError):
+                        # the sink will never take this event: drop it like an invalid one
+                        logging.error(f"Sink rejected event {evt.event_id}, dropping it: {e}")
+                        offsets.mark(msg)
+                    else:
+                        delay = min(retry_max, 0.1 * 2 ** failures)
+                        failures += 1
+                        logging.error(
+                            f"Sink write failed for event {evt.event_id}: {e}; "
+                            f"retrying partition {msg.partition()} from offset {msg.offset()} in {delay:.1f}s"
+                        )
+                        try:
+                            source.seek(msg.partition(), msg.offset())
+                        except NotImplementedError:
+                            logging.error(f"{source.topic} cannot re-read the event, stopping")
+                            break
+                        if shutdown:
+                            shutdown.event.wait(delay)
                         else:
-                            seen_ids.add(evt.event_id)
-                    if status_filter and evt.status not in status_filter:
-                        continue
-                    ok += 1
-                    # sum amounts 
-                    amt = evt.amount if isinstance(evt.amount, Decimal) else Decimal(str(evt.amount))
-                    total += amt
-                    # group totals by chosen field
-                    if group_by == "category":
-                        group_key = getattr(evt, "category", None)
-                        if group_key:
-                            group_totals[group_key] += amt
-                    # new lines for min/max
-                    if min_amt is None or amt < min_amt:
-                        min_amt = amt
-                    if max_amt is None or amt > max_amt:
-                        max_amt = amt
-                    if min_amount is not None and amt < min_amount:
-                        continue
-                    if max_amount is not None and amt > max_amount:
+                            time.sleep(delay)
                         continue
+            else:
+                offsets.mark(msg)
 
-                    status_counts[evt.status] += 1
-                    type_counts[evt.event_type] += 1
-                    d = evt.model_dump()
-                    if isinstance(d.get("amount"), Decimal):
-                        d["amount"] = str(d["amount"])
-                    rows.append(d)
-                    if to_postgres:
-                        cur.execute(UPSERT, _to_db_dict(evt))
-                except Exception as e:
-                    err += 1
-                    logging.error(f"[line {i}] invalid event: {e}")
-                if i % 100 == 0:
-                    logging.info(f"Processed {i} lines so far → valid: {ok}, errors: {err}")
-                if currency_filter and evt.currency.upper() not in currency_filter:
-                    continue
+            count += 1
+
+            with st_log:
+                if print_events:
+                    logging.info(f"Event #{count}: {json.dumps(payload)}")
+                else:
+                    logging.info(f"Received event #{count}: {evt.order_id}")
 
-        if to_postgres and conn:
-            conn.commit()
+            # Metrics every N events 
+            if count % report_every == 0:
+                now = time.perf_counter()
+                total_elapsed = now - start_ts
+                window_elapsed = now - last_report_ts
+
+                avg_rate = count / total_elapsed if total_elapsed > 0 else 0.0
+                window_rate = (
+                    (count - last_report_count) / window_elapsed
+                    if window_elapsed > 0
+                    else 0.0
+                )
+
+                batching = sink.describe() if sink else ""
+                logging.info(
+                    f"Metrics: total={count} | avg={avg_rate:.2f} ev/s | "
+                    f"last{report_every}={window_rate:.2f} ev/s | "
+                    f"elapsed={total_elapsed:.2f}s"
+                    + (f" | {batching}" if batching else "")
+                )
+
+                last_report_ts = now
+                last_report_count = count
+                prof.checkpoint()
+
+            if limit and count >= limit:
+                break
+
+    except KeyboardInterrupt:
+        logging.warning("Stopping stream without draining; uncommitted events will be redelivered")
+        raise
     finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+        source.on_revoke = None
+        source.on_lost = None
+        if filters:
+            logging.info(f"Filtered out {filtered} events")
+
+    if shutdown and shutdown.requested():
+        logging.info(f"Draining after {shutdown.reason}: flushing sink, then committing offsets (timeout {drain_timeout:.0f}s)")
+    with st_sink:
+        try:
+            run_bounded(checkpoint, drain_timeout)
+        except (DrainTimeout, KeyboardInterrupt):
+            # the drain thread may still be running: it must not commit once we give up
+            if not offsets.close():
+                logging.warning("An offset commit is still in progress while giving up the drain")
+            raise
+    return count, inserted
+
+
+def make_source(kind: str, topic: str, group_id: str, file: Path | None = None, partitions: int = 1) -> Source:
+    """Build the streaming source selected on the command line"""
+    if kind == "kafka":
+        return KafkaSource(topic, group_id)
+    if kind == "file":
+        return FileSource(file, topic=topic)
+    if kind == "memory":
+        # stream_events commits offsets itself once the sink has flushed
+        return MemorySource(load_memory_broker(file, topic, partitions), topic, group_id, auto_commit=False)
+    raise ValueError(f"Unknown source: {kind}")
+
+
+def load_memory_broker(file: Path, topic: str, partitions: int = 1) -> MemoryBroker:
+    """Preload an in-process broker from a JSONL file so runs are repeatable.
+
+    Each message is stamped with its event_ts, like a producer publishing in
+    real time would, so timestamp lookups behave as they do on Redpanda.
+    """
+    broker = MemoryBroker(partitions=partitions)
+    with Path(file).open("rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ts = parse_ts(json.loads(line)["event_ts"])
+            except Exception:
+                ts = None
+            broker.produce(topic, line, timestamp=ts)
+    return broker
 
-    if to_csv:
-        out = Path("data/validated_orders.csv")
-        out.parent.mkdir(parents=True, exist_ok=True)
-        if rows:
-            fieldnames = list(rows[0].keys())
-            with out.open("w", newline="", encoding="utf-8") as f:
-                w = csv.DictWriter(f, fieldnames=fieldnames)
-                w.writeheader()
-                w.writerows(rows)
 
-    return ok, err, total, status_counts, type_counts, min_amt, max_amt, duplicates, group_totals
+def parse_datetime(value: str) -> datetime:
+    """ISO-8601 timestamp (naive values are UTC)"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def parse_ts(value: str) -> int:
+    """ISO-8601 timestamp to epoch milliseconds"""
+    return to_micros(parse_datetime(value)) // 1000
+
+
+def make_sink(kind: str | None, controller: BatchController | None = None) -> Sink | None:
+    """Build the sink selected on the command line.
+
+    With a controller, writes go through a BatchingSink; for Postgres that
+    means one transaction per adaptively sized batch.
+    """
+    if kind is None:
+        return None
+    if kind == "postgres":
+        sink = PostgresSink(autocommit=controller is None)
+    elif kind == "csv":
+        sink = CsvSink(Path("data/validated_orders.csv"))
+    elif kind == "memory":
+        sink = MemorySink()
+    elif kind == "null":
+        sink = NullSink()
+    else:
+        raise ValueError(f"Unknown sink: {kind}")
+    return BatchingSink(sink, controller) if controller else sink
+
 
 def check_postgres() -> tuple[bool, str]:
     try:
-        conn = pg_connect()
-        cur = conn.cursor()
-        cur.execute("SELECT 1;")
-        cur.fetchone()
-        cur.close()
-        conn.close()
+        # the pool checks the connection it hands out; no retries so a down
+        # server is reported right away
+        with get_pool().connection(retries=0) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+                cur.fetchone()
         return True, f"Postgres OK at {PG_HOST}:{PG_PORT} db={PG_DB}"
     except Exception as e:
         return False, f"Postgres FAIL at {PG_HOST}:{PG_PORT} db={PG_DB} error={e}"
@@ -187,7 +498,7 @@ def check_postgres() -> tuple[bool, str]:
 
 def check_redpanda(topic: str) -> tuple[bool, str]:
     try:
-        admin = AdminClient({"bootstrap.servers": "localhost:9092"})
+        admin = AdminClient({"bootstrap.servers": BOOTSTRAP_SERVERS})
         md = admin.list_topics(timeout=5)
         topics = set(md.topics.keys())
         if topic in topics:
@@ -282,6 +593,7 @@ def main():
     parser.add_argument(
     "--group-by",
     type=str,
+    choices=list(ENCODED),
     help="Group totals by the given field"
     )
     parser.add_argument(
@@ -318,12 +630,120 @@ def main():
     help="Log throughput every N events in streaming mode"
     )
     parser.add_argument(
+    "--source",
+    choices=["kafka", "file", "memory"],
+    help="Stream from this source (kafka = Redpanda, file = --file line by line, "
+         "memory = in-process broker preloaded from --file)"
+    )
+    parser.add_argument(
+    "--sink",
+    choices=["postgres", "csv", "memory", "null"],
+    help="Where streamed events go (default: postgres with --to-postgres, else none)"
+    )
+    parser.add_argument(
+    "--partitions",
+    type=int,
+    default=1,
+    help="Number of partitions for --source memory"
+    )
+    parser.add_argument(
+    "--replay",
+    action="store_true",
+    help="Re-read a time range of the topic partition by partition in parallel, "
+         "without touching the consumer group's offsets"
+    )
+    parser.add_argument(
+    "--from-ts",
+    type=str,
+    help="Replay/--file/--segments start, ISO-8601 (inclusive, e.g. 2025-08-21T00:00:00Z)"
+    )
+    parser.add_argument(
+    "--to-ts",
+    type=str,
+    help="Replay/--file/--segments end, ISO-8601 (exclusive; default: current end of each partition)"
+    )
+    parser.add_argument(
+    "--to-segments",
+    type=str,
+    metavar="DIR",
+    help="Also append validated events to DIR as columnar segment files"
+    )
+    parser.add_argument(
+    "--segments",
+    type=str,
+    metavar="DIR",
+    help="Read validated events from the segment files in DIR instead of --file"
+    )
+    parser.add_argument(
+    "--drain-timeout",
+    type=float,
+    default=25.0,
+    help="Seconds allowed on SIGTERM/SIGINT to flush the sink and commit offsets before exiting (default 25)"
+    )
+    parser.add_argument(
+    "--from-postgres",
+    action="store_true",
+    help="Report from the orders_summary table maintained by the Postgres sink instead of reading --file"
+    )
+    parser.add_argument(
+    "--segment-rows",
+    type=int,
+    default=65536,
+    help="Rows per segment file written by --to-segments (default 65536)"
+    )
+    parser.add_argument(
+    "--workers",
+    type=int,
+    help="Parallel replay workers (default: one per partition)"
+    )
+    parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=1000,
+    help="Events per bulk insert when replaying; largest adaptive batch when streaming"
+    )
+    parser.add_argument(
+    "--target-p99-ms",
+    type=float,
+    default=500.0,
+    help="Streaming Postgres sink: p99 receive-to-commit latency the batch controller aims for "
+         "(0 = write and autocommit every event)"
+    )
+    parser.add_argument(
+    "--profile",
+    type=str,
+    metavar="PATH",
+    help="Write a per-stage CPU report (sampled, low overhead) to PATH at exit"
+    )
+    parser.add_argument(
+    "--profile-sample-every",
+    type=int,
+    default=16,
+    help="Time one in N stage entries when profiling (default: 16)"
+    )
+    parser.add_argument(
+    "--profile-cprofile",
+    action="store_true",
+    help="With --profile, also run cProfile and dump it to PATH.pstats (slows the run down several times)"
+    )
+    parser.add_argument(
+    "--profile-alloc",
+    action="store_true",
+    help="With --profile, also trace allocations with tracemalloc and report the top sites (slow)"
+    )
+    parser.add_argument(
     "--healthcheck",
     action="store_true",
     help="Check Redpanda and Postgres connectivity, then exit"
     )
 
     args = parser.parse_args()
+    if (args.profile_cprofile or args.profile_alloc) and not args.profile:
+        parser.error("--profile-cprofile and --profile-alloc need --profile PATH")
+    profiler = start_profiling(
+        args.profile, sample_every=args.profile_sample_every,
+        use_cprofile=args.profile_cprofile, trace_alloc=args.profile_alloc,
+    )
 
     if args.healthcheck:
         ok_rp, msg_rp = check_redpanda(args.topic)
@@ -345,9 +765,43 @@ def main():
     f"pg_host={PG_HOST} pg_port={PG_PORT} pg_db={PG_DB}"
     )
 
+    currency_filter: set[str] | None = None
+    if args.currency:
+        chosen = {c.strip().upper() for c in args.currency.split(",") if c.strip()}
+        currency_filter = chosen
+
+    min_amount: Decimal | None = Decimal(str(args.min_amount)) if args.min_amount is not None else None
+    max_amount: Decimal | None = Decimal(str(args.max_amount)) if args.max_amount is not None else None
+
+    allowed_statuses = {"PLACED","CONFIRMED","SHIPPED","DELIVERED","CANCELLED"}
+    status_filter: set[str] | None = None
+    if args.status:
+        chosen = {s.strip().upper() for s in args.status.split(",") if s.strip()}
+        invalid = chosen - allowed_statuses
+        if invalid:
+            raise ValueError(f"Invalid statuses: {sorted(invalid)}. Allowed: {sorted(allowed_statuses)}")
+        status_filter = chosen
+
+    filters = compile_filters(status_filter, currency_filter, min_amount, max_amount)
+
+    streaming = args.from_redpanda or args.source is not None
+    source_kind = args.source or "kafka"
+    sink_kind = args.sink or ("postgres" if args.to_postgres else None)
+
         # ---- automatic healthcheck for normal runs ----
-    need_redpanda = args.from_redpanda
-    need_postgres = args.to_postgres
+    need_redpanda = (streaming or args.replay) and source_kind == "kafka"
+    need_postgres = args.to_postgres or args.from_postgres or ((streaming or args.replay) and sink_kind == "postgres")
+
+    if args.from_postgres:
+        if filters or args.from_ts or args.to_ts or args.segments:
+            parser.error("--from-postgres reports on the whole table; filters, --from-ts/--to-ts and --segments need --file or --segments")
+        if args.detect_outliers or args.to_postgres:
+            parser.error("--from-postgres only reads the summary; --detect-outliers and --to-postgres need --file or --segments")
+
+    if args.segments and (args.limit or args.check_duplicates):
+        parser.error("--segments reads stored events; --limit and --check-duplicates need --file")
+    if streaming and not args.replay and (args.from_ts or args.to_ts):
+        parser.error("--from-ts/--to-ts select a range to read; use them with --replay, --file or --segments")
 
     if need_redpanda or need_postgres:
         require_healthy(
@@ -356,145 +810,131 @@ def main():
             need_postgres=need_postgres
         )
 
-    kafka_consumer = None
-    if args.from_redpanda:
-        logging.info("Streaming from Redpanda...")
+    if args.replay:
+        if sink_kind == "csv":
+            parser.error("--replay writes from several workers at once; use --to-postgres, --sink null or --sink memory")
+        from_ms = parse_ts(args.from_ts) if args.from_ts else None
+        to_ms = parse_ts(args.to_ts) if args.to_ts else None
 
-        kafka_consumer = KafkaConsumer({
-            "bootstrap.servers": "localhost:9092",
-            "group.id": args.group_id,
-            "auto.offset.reset": "earliest",
-        })
-        kafka_consumer.subscribe([args.topic])
+        if source_kind == "memory":
+            broker = load_memory_broker(Path(args.file), args.topic, args.partitions)
+            ranges = broker.partition_ranges(args.topic, from_ms, to_ms)
 
-        count = 0
-        inserted = 0
+            def open_source(partition: int, start: int, end: int) -> Source:
+                return MemoryPartitionSource(broker, args.topic, partition, start, end)
+        elif source_kind == "kafka":
+            ranges = kafka_partition_ranges(args.topic, from_ms, to_ms)
+
+            def open_source(partition: int, start: int, end: int) -> Source:
+                return KafkaPartitionSource(args.topic, partition, start, end, group_id=f"{args.group_id}-replay")
+        else:
+            parser.error("--replay reads from --source kafka or --source memory")
+
+        for partition, start, end in ranges:
+            logging.info(f"Replay partition {partition}: offsets [{start}, {end}) → {end - start} messages")
 
-        # Performance metrics 
         start_ts = time.perf_counter()
-        last_report_ts = start_ts
-        last_report_count = 0
-        report_every = args.metrics_every  
+        try:
+            ok, written, err = replay(
+                ranges, open_source, lambda: make_sink(sink_kind),
+                workers=args.workers, batch_size=args.batch_size, filters=filters, profiler=profiler,
+            )
+        except KeyboardInterrupt:
+            # writes are idempotent: rerunning the same replay picks up what is missing
+            logging.error(f"Replay interrupted after {time.perf_counter() - start_ts:.2f}s; rerun it to complete the range")
+            raise SystemExit(1)
+        elapsed = time.perf_counter() - start_ts
+        rate = ok / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Replayed {ok} valid events ({err} errors) from {source_kind}, "
+            f"wrote {written} to {sink_kind or 'no sink'} in {elapsed:.2f}s ({rate:.2f} ev/s)"
+        )
+        return
 
-        conn = None
-        cur = None
+    if streaming:
+        logging.info(f"Streaming from {source_kind}...")
+
+        source = None
+        sink = None
+        count = 0
+        inserted = 0
+        drained = False
+        # SIGTERM/SIGINT end the loop; the sink and offsets are drained before exit
+        shutdown = ShutdownSignal().install()
 
         try:
-            if args.to_postgres:
+            source = make_source(source_kind, args.topic, args.group_id, file=Path(args.file), partitions=args.partitions)
+            if sink_kind == "postgres":
                 logging.info(
                     f"Connecting to Postgres at {PG_HOST}:{PG_PORT}, db={PG_DB} as {PG_USER}"
                 )
-                conn = pg_connect()
-                ensure_db(conn)
-                cur = conn.cursor()
+            controller = None
+            if sink_kind and args.target_p99_ms > 0:
+                controller = BatchController(target_p99_ms=args.target_p99_ms, max_size=args.batch_size)
+            sink = make_sink(sink_kind, controller)
+            if sink_kind == "postgres":
                 logging.info("Postgres connection ready, starting streaming upsert")
 
-            while True:
-                msg = kafka_consumer.poll(1.0)
-                if msg is None:
-                    continue
-                if msg.error():
-                    logging.error(f"Kafka error: {msg.error()}")
-                    continue
-
-                payload = json.loads(msg.value().decode("utf-8"))
-                try:
-                    evt = validate_event(payload)
-                except Exception as e:
-                    logging.error(f"Invalid event from Redpanda: {e}")
-                    continue
-
-                count += 1
-
-                if args.to_postgres and cur:
-                    try:
-                        cur.execute(UPSERT, _to_db_dict(evt))
-                        inserted += 1
-                    except Exception as e:
-                        logging.error(
-                            f"Postgres insert failed for event {evt.event_id}: {e}"
-                        )
-
-                if args.print_events:
-                    logging.info(f"Event #{count}: {json.dumps(payload)}")
-                else:
-                    logging.info(f"Received event #{count}: {evt.order_id}")
-
-                # Metrics every N events 
-                if count % report_every == 0:
-                    now = time.perf_counter()
-                    total_elapsed = now - start_ts
-                    window_elapsed = now - last_report_ts
-
-                    avg_rate = count / total_elapsed if total_elapsed > 0 else 0.0
-                    window_rate = (
-                        (count - last_report_count) / window_elapsed
-                        if window_elapsed > 0
-                        else 0.0
-                    )
-
-                    logging.info(
-                        f"Metrics: total={count} | avg={avg_rate:.2f} ev/s | "
-                        f"last{report_every}={window_rate:.2f} ev/s | "
-                        f"elapsed={total_elapsed:.2f}s"
-                    )
-
-                    last_report_ts = now
-                    last_report_count = count
-
-                if args.limit and count >= args.limit:
-                    break
-
-            if args.to_postgres and conn:
-                conn.commit()
+            count, inserted = stream_events(
+                source, sink, limit=args.limit, print_events=args.print_events, metrics_every=args.metrics_every,
+                filters=filters, profiler=profiler, shutdown=shutdown, drain_timeout=args.drain_timeout,
+            )
+            drained = True
 
         except KeyboardInterrupt:
-            logging.info("Stopping stream")
-
+            logging.error("Aborted without draining; events after the last committed offsets will be redelivered")
+            raise SystemExit(1)
+        except DrainTimeout as e:
+            logging.error(f"{e}; exiting, events after the last committed offsets will be redelivered")
+            raise SystemExit(1)
         finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
+            # an undrained sink is not flushed again: that could block past
+            # the deadline, and its events are redelivered anyway
+            if sink and drained:
+                sink.close()
             try:
-                kafka_consumer.close()
+                if source:
+                    # leaves the group right away so partitions move without waiting for a session timeout
+                    source.close()
             except Exception:
                 pass
+            shutdown.restore()
             logging.info(
-                f"Consumed {count} events from Redpanda, "
-                f"inserted {inserted} into Postgres"
+                f"Consumed {count} events from {source_kind}, "
+                f"wrote {inserted} to {sink_kind or 'no sink'}"
             )
         return
 
-    currency_filter: set[str] | None = None
-    if args.currency:
-        chosen = {c.strip().upper() for c in args.currency.split(",") if c.strip()}
-        currency_filter = chosen
-
-    min_amount: Decimal | None = Decimal(str(args.min_amount)) if args.min_amount is not None else None
-    max_amount: Decimal | None = Decimal(str(args.max_amount)) if args.max_amount is not None else None
-
-    allowed_statuses = {"PLACED","CONFIRMED","SHIPPED","DELIVERED","CANCELLED"}
-    status_filter: set[str] | None = None
-    if args.status:
-        chosen = {s.strip().upper() for s in args.status.split(",") if s.strip()}
-        invalid = chosen - allowed_statuses
-        if invalid:
-            raise ValueError(f"Invalid statuses: {sorted(invalid)}. Allowed: {sorted(allowed_statuses)}")
-        status_filter = chosen
-
     if args.show_schema:
         print(DDL.strip())
         raise SystemExit(0)
     
-    path = Path(args.file)
-    if not path.is_file():
-        raise FileNotFoundError(f"File not found: {path}")
-
-    ok, err, total, status_counts, type_counts, min_amt, max_amt, duplicates, group_totals = validate_file(
-    path, to_postgres=args.to_postgres, to_csv=args.to_csv, status_filter=status_filter, limit=args.limit, check_duplicates=args.check_duplicates,min_amount=min_amount,
-    max_amount=max_amount, group_by=args.group_by,
-    )
+    from_dt = parse_datetime(args.from_ts) if args.from_ts else None
+    to_dt = parse_datetime(args.to_ts) if args.to_ts else None
+
+    if args.from_postgres:
+        ok, err, total, status_counts, type_counts, min_amt, max_amt, duplicates, group_totals = summarize_postgres(args.group_by)
+    elif args.segments:
+        path = Path(args.segments)
+        if not path.is_dir():
+            raise FileNotFoundError(f"Segment directory not found: {path}")
+        ok, err, total, status_counts, type_counts, min_amt, max_amt, duplicates, group_totals = validate_segments(
+            path, to_postgres=args.to_postgres, to_csv=args.to_csv, group_by=args.group_by, filters=filters,
+            from_ts=from_dt, to_ts=to_dt, profiler=profiler,
+        )
+    else:
+        path = Path(args.file)
+        if not path.is_file():
+            raise FileNotFoundError(f"File not found: {path}")
+
+        ok, err, total, status_counts, type_counts, min_amt, max_amt, duplicates, group_totals = validate_file(
+        path, to_postgres=args.to_postgres, to_csv=args.to_csv, status_filter=status_filter, currency_filter=currency_filter, limit=args.limit, check_duplicates=args.check_duplicates,min_amount=min_amount,
+        max_amount=max_amount, group_by=args.group_by, filters=filters, profiler=profiler,
+        batch_size=args.segment_rows if args.to_segments else 8192,
+        to_segments=Path(args.to_segments) if args.to_segments else None, from_ts=from_dt, to_ts=to_dt,
+        )
+        if args.to_segments:
+            logging.info(f"Appended segments to {args.to_segments}")
     avg = (total / ok).quantize(Decimal("0.01")) if ok else Decimal("0.00")
     label = f" (status in {','.join(sorted(status_filter))})" if status_filter else ""
     logging.info(f"{ok} events valid | {err} errors | total: {total} | avg: {avg}{label}")
@@ -515,26 +955,42 @@ def main():
         logging.info(
             f"Detecting outliers (amount < {lower_threshold} or > {upper_threshold})..."
         )
-        with path.open("r", encoding="utf-8") as f:
-            for i, line in enumerate(f, start=1):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    payload = json.loads(line)
-                    evt = validate_event(payload)
-                    amt = (
-                        evt.amount
-                        if isinstance(evt.amount, Decimal)
-                        else Decimal(str(evt.amount))
+        # same events as the report above: the filters, the window or --limit apply here too
+        lo, hi = math.ceil(lower_threshold * 100), math.floor(upper_threshold * 100)
+        from_us = to_micros(from_dt) if from_dt else None
+        to_us = to_micros(to_dt) if to_dt else None
+        if args.segments:
+            for batch in scan_segments(path, filters, from_us, to_us):
+                for i in np.flatnonzero((batch.amount_cents < lo) | (batch.amount_cents > hi)).tolist():
+                    logging.warning(
+                        f"Outlier → order_id={batch.order_id[i]} | amount={cents_to_decimal(batch.amount_cents[i])}"
                     )
-                    if amt < lower_threshold or amt > upper_threshold:
+        else:
+            matched = 0
+            with path.open("rb") as f:
+                for i, line in enumerate(f, start=1):
+                    if args.limit and matched >= args.limit:
+                        break
+                    line = line.strip()
+                    if not line or (filters and not filters.match_bytes(line)):
+                        continue
+                    try:
+                        payload = json.loads(line)
+                        if filters and not filters.match_payload(payload):
+                            continue
+                        evt = validate_event(payload)
+                    except Exception:
+                        # ignore invalid lines
+                        continue
+                    ts = to_micros(evt.event_ts)
+                    if (from_us is not None and ts < from_us) or (to_us is not None and ts >= to_us):
+                        continue
+                    matched += 1
+                    cents = to_cents(evt.amount)
+                    if cents < lo or cents > hi:
                         logging.warning(
-                            f"Outlier → order_id={evt.order_id} | amount={amt} | line={i}"
+                            f"Outlier → order_id={evt.order_id} | amount={cents_to_decimal(cents)} | line={i}"
                         )
-                except Exception:
-                    # ignore invalid lines
-                    continue
 
     if args.summary:
         summary = {
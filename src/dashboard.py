@@ -1,29 +1,22 @@
 import os
+import sys
+from pathlib import Path
 import pandas as pd
 import streamlit as st
-import psycopg2
-
-PG_HOST = os.getenv("PG_HOST", "localhost")
-PG_PORT = int(os.getenv("PG_PORT", "5433"))
-PG_USER = os.getenv("PG_USER", "postgres")  # Update user
-PG_PASSWORD = os.getenv("PG_PASSWORD", "postgres")  # Update password
-PG_DB = os.getenv("PG_DB", "postgres")
-
-def get_conn():
-    return psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        dbname=PG_DB
-    )
+
+# `streamlit run src/dashboard.py` only puts src/ on sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# docker-compose publishes Postgres on 5433; keep that as the dashboard default
+os.environ.setdefault("PG_PORT", "5433")
+
+from src.common.db import PG_HOST, PG_PORT, PG_DB, get_pool  # noqa: E402
 
 @st.cache_data(ttl=5)
 def load_events():
-    conn = get_conn()
-    df = pd.read_sql("SELECT * FROM orders_events;", conn)
-    conn.close()
-    return df
+    # connections are reused across reruns; the pool drops dead ones and
+    # reconnects with backoff if Postgres restarted
+    with get_pool().connection() as conn:
+        return pd.read_sql("SELECT * FROM orders_events;", conn)
 
 st.set_page_config(page_title="StreamCart Realtime ETL System Dashboard", layout="wide")
 st.title("StreamCart Realtime ETL System Dashboard")
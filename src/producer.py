@@ -5,6 +5,7 @@ from faker import Faker
 from src.common.models import OrderEvent
 from decimal import Decimal
 from confluent_kafka import Producer as KafkaProducer
+from src.common.profiling import start_profiling
 
 fake = Faker()
 CATEGORIES = ["electronics", "fashion", "groceries", "beauty", "sports", "books"]
@@ -50,8 +51,30 @@ def main():
     action="store_true",
     help="If set, publish events to a Redpanda topic (in addition to writing to file)"
     )
+    parser.add_argument(
+    "--profile",
+    type=str,
+    metavar="PATH",
+    help="Write a per-stage CPU report (sampled, low overhead) to PATH at exit"
+    )
+    parser.add_argument(
+    "--profile-cprofile",
+    action="store_true",
+    help="With --profile, also run cProfile and dump it to PATH.pstats (slows the run down several times)"
+    )
+    parser.add_argument(
+    "--profile-alloc",
+    action="store_true",
+    help="With --profile, also trace allocations with tracemalloc and report the top sites (slow)"
+    )
 
     args = parser.parse_args()
+    if (args.profile_cprofile or args.profile_alloc) and not args.profile:
+        parser.error("--profile-cprofile and --profile-alloc need --profile PATH")
+    profiler = start_profiling(args.profile, use_cprofile=args.profile_cprofile, trace_alloc=args.profile_alloc)
+    st_generate, st_serialize, st_write, st_publish, st_log = (
+        profiler.stage(name) for name in ("generate", "serialize", "write", "publish", "log")
+    )
 
     forced_currency = args.currency.upper() if args.currency else None
 
@@ -76,19 +99,25 @@ def main():
         topic = "orders"
 
     for _ in range(args.count):
-        evt = make_order_event(forced_currency=forced_currency)
-        line = json.dumps(evt, default=str)
-        print(line)
-        with open(log_file, mode, encoding="utf-8") as f:
-            f.write(line + "\n")
+        with st_generate:
+            evt = make_order_event(forced_currency=forced_currency)
+        with st_serialize:
+            line = json.dumps(evt, default=str)
+        with st_log:
+            print(line)
+        with st_write:
+            with open(log_file, mode, encoding="utf-8") as f:
+                f.write(line + "\n")
         mode = "a"
     
         # publish to Redpanda
         if kafka_producer:
-            kafka_producer.produce(topic, value=line.encode("utf-8"))
+            with st_publish:
+                kafka_producer.produce(topic, value=line.encode("utf-8"))
             # kafka_producer.flush(0.1)
     if kafka_producer:
-        kafka_producer.flush() 
+        with st_publish:
+            kafka_producer.flush() 
 
     print(f"Wrote {args.count} events to {log_file}")
 
@@ -1,3 +1,67 @@
 import os, sys
 # adds project root  to the import path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# helpers shared by several test modules
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import psycopg2.errors
+
+from src.common.models import OrderEvent
+from src.common.sinks import MemorySink
+from src.common.sources import MemoryBroker
+
+
+def make_line(i: int, status: str = "PLACED", currency: str = "USD", amount: float = 10.0) -> bytes:
+    return json.dumps({
+        "event_id": f"evt_{i}",
+        "event_type": "order_created",
+        "event_ts": datetime(2025, 8, 21, tzinfo=timezone.utc).isoformat(),
+        "order_id": f"ord_{i}",
+        "customer_id": "cus_1",
+        "status": status,
+        "amount": amount,
+        "currency": currency,
+        "items_count": 1,
+        "category": "books",
+    }).encode("utf-8")
+
+
+def make_event(i: int, status: str = "PLACED", currency: str = "USD", amount: str = "10.00", category: str = "books") -> OrderEvent:
+    return OrderEvent(
+        event_id=f"evt_{i}",
+        event_type="order_created",
+        event_ts=datetime(2025, 8, 21, 12, 0, i, 250, tzinfo=timezone.utc),
+        order_id=f"ord_{i}",
+        customer_id="cus_1",
+        status=status,
+        amount=Decimal(amount),
+        currency=currency,
+        items_count=2,
+        category=category,
+    )
+
+
+def make_broker(n: int = 30, partitions: int = 3) -> MemoryBroker:
+    """`n` make_line() events round-robin over the "orders" partitions, one per second from t=1000s"""
+    broker = MemoryBroker(partitions=partitions)
+    for i in range(n):
+        broker.produce("orders", make_line(i), timestamp=(1000 + i) * 1000)
+    return broker
+
+
+class RejectingSink(MemorySink):
+    """Refuses whole calls that contain a bad event, like one failing INSERT"""
+
+    def __init__(self, bad: set[str]):
+        super().__init__()
+        self.bad = bad
+        self.calls = 0
+
+    def write_many(self, events):
+        self.calls += 1
+        if any(e.event_id in self.bad for e in events):
+            raise psycopg2.errors.NumericValueOutOfRange("numeric field overflow")
+        super().write_many(events)
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from src.common.batching import BatchController
+from src.common.sinks import BatchingSink, MemorySink
+from src.common.sources import MemoryBroker, MemorySource
+from src.consumer import stream_events
+from tests.conftest import RejectingSink, make_event, make_line
+
+
+def test_controller_grows_under_backlog():
+    ctl = BatchController(target_p99_ms=500, initial_size=10, max_size=40)
+    assert ctl.record_flush(10, 0.01, 0.05, 0.01, backlog=1000) == "grow"
+    assert ctl.batch_size == 20
+    ctl.record_flush(20, 0.01, 0.05, 0.01, backlog=1000)
+    ctl.record_flush(40, 0.01, 0.05, 0.01, backlog=1000)
+    assert ctl.batch_size == 40
+
+
+def test_controller_shrinks_when_over_target():
+    ctl = BatchController(target_p99_ms=100, initial_size=64)
+    interval = ctl.flush_interval
+    assert ctl.record_flush(64, 0.05, 0.3, 0.2, backlog=0) == "shrink"
+    assert ctl.batch_size == 32
+    assert ctl.flush_interval == interval / 2
+
+
+def test_controller_follows_sparse_traffic():
+    ctl = BatchController(target_p99_ms=100, initial_size=64)
+    decision = ctl.record_flush(3, 0.001, 0.06, 0.01, backlog=0)
+    assert decision == "fit" and ctl.batch_size == 3
+    assert "decision=fit" in ctl.describe()
+
+
+def test_batching_sink_flushes_on_size_and_age():
+    inner = MemorySink()
+    sink = BatchingSink(inner, BatchController(initial_size=3, min_interval=0.01, target_p99_ms=20))
+    for i in range(2):
+        sink.write(i)
+    sink.maybe_flush()
+    assert inner.written == 0
+    sink.write(2)
+    sink.maybe_flush()
+    assert inner.written == 3 and inner.flushes == 1
+
+    sink.write(3)
+    time.sleep(sink.controller.flush_interval + 0.01)
+    sink.maybe_flush()
+    assert inner.written == 4
+
+
+class FlakySink(MemorySink):
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+
+    def write_many(self, events):
+        if self.fail:
+            raise RuntimeError("db down")
+        super().write_many(events)
+
+
+def test_batching_sink_drops_rejected_rows_and_keeps_the_rest():
+    inner = RejectingSink({"evt_7", "evt_30"})
+    sink = BatchingSink(inner)
+    for i in range(50):
+        sink.write(make_event(i))
+    sink.flush()
+    assert not sink.pending and sink.rejected == 2 and sink.written == 48
+    assert sorted(e.event_id for e in inner.events) == sorted(f"evt_{i}" for i in range(50) if i not in (7, 30))
+    assert inner.calls < 50  # bisected, not row by row
+
+
+def test_batching_sink_keeps_batch_when_inner_sink_fails():
+    inner = FlakySink()
+    sink = BatchingSink(inner)
+    sink.write("a")
+    with pytest.raises(RuntimeError):
+        sink.flush()
+    assert sink.pending == ["a"]
+    inner.fail = False
+    sink.flush()
+    assert inner.events == ["a"] and not sink.pending
+
+
+def test_stream_events_with_batching_sink():
+    broker = MemoryBroker(partitions=2)
+    for i in range(50):
+        broker.produce("orders", make_line(i))
+    inner = MemorySink()
+    sink = BatchingSink(inner, BatchController(initial_size=8))
+    count, _ = stream_events(MemorySource(broker, "orders", "g1"), sink)
+    assert count == 50 and inner.written == 50
+    # backlog made the controller grow past its initial size
+    assert sink.controller.batch_size > 8
+
+
+def test_stream_events_wakes_up_for_the_flush_deadline():
+    broker = MemoryBroker(partitions=1)
+    broker.produce("orders", make_line(1))
+    inner = MemorySink()
+    sink = BatchingSink(inner, BatchController(target_p99_ms=200, initial_size=100))
+    timeouts = []
+
+    class SparseSource(MemorySource):
+        # one event, then a quiet topic where poll() blocks for its whole timeout
+        def poll(self, timeout=1.0):
+            timeouts.append(timeout)
+            msg = super().poll(timeout)
+            if msg is None:
+                if inner.events:
+                    self.exhausted = True
+                else:
+                    time.sleep(timeout)
+            return msg
+
+    start = time.perf_counter()
+    stream_events(SparseSource(broker, "orders", "g1", stop_at_end=False), sink)
+    assert inner.written == 1 and time.perf_counter() - start < 0.5
+    assert timeouts[0] == 1.0 and timeouts[1] <= sink.controller.flush_interval
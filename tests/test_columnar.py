@@ -0,0 +1,125 @@
+import json
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from src.common.columnar import BatchStats, EventBatch, EventBatchBuilder, to_cents, to_micros
+from src.common.filters import FilterPlan
+from src.common.sinks import MemorySink
+from src.consumer import validate_file
+from tests.conftest import RejectingSink, make_event, make_line
+
+
+def test_batch_stores_typed_columns_and_round_trips():
+    events = [make_event(1, amount="12.34"), make_event(2, status="SHIPPED", currency="INR", category="beauty")]
+    batch = EventBatch.from_events(events)
+
+    assert len(batch) == 2
+    assert batch.amount_cents.dtype == np.int64 and batch.amount_cents.tolist() == [1234, 1000]
+    assert batch.event_ts.dtype == np.int64 and batch.event_ts[0] == to_micros(events[0].event_ts)
+    assert batch.status.dtype == np.uint8 and batch.categories == ["books", "beauty"]
+
+    back = batch.to_events()
+    assert [e.model_dump() for e in back] == [e.model_dump() for e in events]
+
+
+def test_amounts_round_to_cents():
+    # same as Postgres NUMERIC(10,2): halves round away from zero, not to even
+    assert to_cents(Decimal("0.005")) == 1
+    assert to_cents(Decimal("0.015")) == 2
+    assert to_cents(Decimal("10.005")) == 1001
+    assert to_cents(Decimal("0.0049")) == 0
+    assert to_cents(Decimal("173.25")) == 17325
+
+
+def test_vectorized_aggregations():
+    batch = EventBatch.from_events([
+        make_event(1, amount="1.50", category="books"),
+        make_event(2, amount="2.25", status="SHIPPED", category="sports"),
+        make_event(3, amount="3.00", category="books"),
+    ])
+    assert batch.counts("status") == {"PLACED": 2, "SHIPPED": 1}
+    assert batch.totals_by("category") == {"books": Decimal("4.50"), "sports": Decimal("2.25")}
+    assert (batch.total_cents(), batch.min_cents(), batch.max_cents()) == (675, 150, 300)
+    with pytest.raises(ValueError):
+        batch.counts("order_id")
+
+
+def test_filter_plan_mask_matches_payload_checks():
+    batch = EventBatch.from_events([
+        make_event(1, amount="5.00"),
+        make_event(2, amount="50.00", currency="EUR"),
+        make_event(3, amount="50.01", status="SHIPPED"),
+    ])
+    plan = FilterPlan(status_filter={"PLACED"}, max_amount=Decimal("50.005"))
+    assert plan.mask(batch).tolist() == [True, True, False]
+    picked = batch.take(plan.mask(batch))
+    assert picked.event_id == ["evt_1", "evt_2"]
+    assert FilterPlan(currency_filter={"EUR"}).mask(batch).tolist() == [False, True, False]
+
+
+def test_batch_stats_accumulate_across_batches():
+    categories: list[str] = []
+    stats = BatchStats(group_by="currency")
+    for chunk in ([make_event(1, amount="1.00")], [make_event(2, amount="9.99", currency="GBP")]):
+        builder = EventBatchBuilder(categories)
+        for evt in chunk:
+            builder.append(evt)
+        stats.add(builder.build())
+    stats.add(EventBatchBuilder(categories).build())
+
+    assert stats.count == 2 and stats.total == Decimal("10.99")
+    assert (stats.min_amount, stats.max_amount) == (Decimal("1.00"), Decimal("9.99"))
+    assert dict(stats.group_totals) == {"USD": Decimal("1.00"), "GBP": Decimal("9.99")}
+    with pytest.raises(ValueError):
+        BatchStats(group_by="customer_id")
+
+
+def test_validate_file_results_do_not_depend_on_batch_size(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(
+        make_line(i, status=("PLACED", "SHIPPED")[i % 2], amount=1.25 * i) for i in range(25)
+    ) + b"\n")
+
+    one = validate_file(path, group_by="status", batch_size=7, sink=MemorySink())
+    other = validate_file(path, group_by="status", batch_size=1000)
+    assert one == other
+    ok, _, total, status_counts, *_, group_totals = one
+    assert ok == 25 and total == Decimal("375.00")
+    assert status_counts == {"PLACED": 13, "SHIPPED": 12}
+    assert sum(group_totals.values()) == total
+
+
+def test_builder_rejects_values_its_columns_cannot_hold():
+    builder = EventBatchBuilder(categories=[f"c{i}" for i in range(2**16)])
+    with pytest.raises(ValueError, match="categories"):
+        builder.append(make_event(1, category="one_too_many"))
+    with pytest.raises(ValueError, match="items_count"):
+        builder.append(make_event(2, category="c7").model_copy(update={"items_count": 2**31}))
+    with pytest.raises(ValueError, match="amount"):
+        builder.append(make_event(3, category="c7", amount="1e18"))
+    assert len(builder) == 0 and len(builder.categories) == 2**16
+
+    builder.append(make_event(4, category="c7").model_copy(update={"items_count": 2**31 - 1}))
+    assert builder.build().items_count.tolist() == [2**31 - 1]
+
+
+def test_validate_file_counts_unrepresentable_rows_as_errors(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    big = json.loads(make_line(1))
+    big["items_count"] = 2**31
+    path.write_bytes(b"\n".join([make_line(0), json.dumps(big).encode(), make_line(2)]) + b"\n")
+
+    ok, err, total, *_ = validate_file(path)
+    assert (ok, err, total) == (2, 1, Decimal("20.00"))
+
+
+def test_validate_file_drops_rows_the_sink_rejects(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(make_line(i, amount=100_000_000.0 if i in (3, 17) else 1.0) for i in range(20)) + b"\n")
+    sink = RejectingSink({"evt_3", "evt_17"})
+
+    ok, err, total, *_ = validate_file(path, sink=sink, batch_size=8)
+    assert (ok, err, total) == (18, 2, Decimal("18.00"))
+    assert sorted(e.event_id for e in sink.events) == sorted(f"evt_{i}" for i in range(20) if i not in (3, 17))
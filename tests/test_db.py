@@ -0,0 +1,319 @@
+import threading
+import uuid
+from decimal import Decimal
+
+import psycopg2
+import pytest
+from psycopg2.extras import execute_values
+
+import src.common.sinks as sinks
+from src.common.batching import BatchController
+from src.common.columnar import BatchStats, EventBatch
+from src.common.db import (
+    DDL, PG_DB, PG_HOST, PG_PASSWORD, PG_PORT, PG_USER,
+    PgPool, connection_lost, ensure_db, load_summary,
+)
+from src.common.sinks import BatchingSink, PostgresSink
+from tests.conftest import make_event
+
+
+class FakeServer:
+    """Just enough of Postgres to lose connections: commits are keyed by event_id"""
+
+    def __init__(self):
+        self.up = True
+        self.rows: dict[str, object] = {}
+        self.connects = 0
+        self.refuse = 0
+
+    def connect(self):
+        self.connects += 1
+        if not self.up or self.refuse:
+            self.refuse = max(0, self.refuse - 1)
+            raise psycopg2.OperationalError("connection refused")
+        return FakeConn(self)
+
+    def restart(self, refuse: int = 0):
+        # existing connections die, the next `refuse` connects fail
+        self.up = True
+        self.refuse = refuse
+        for conn in list(FakeConn.live):
+            if conn.server is self:
+                conn.closed = 2
+        FakeConn.live.clear()
+
+
+class FakeConn:
+    live: list = []
+
+    def __init__(self, server: FakeServer):
+        self.server = server
+        self.closed = 0
+        self.autocommit = False
+        self.pending: list = []
+        FakeConn.live.append(self)
+
+    def _check(self):
+        if self.closed or not self.server.up:
+            self.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self._check()
+        for row in self.pending:
+            key = row["event_id"] if isinstance(row, dict) else row[0]
+            self.server.rows.setdefault(key, row)
+        self.pending = []
+
+    def rollback(self):
+        self._check()
+        self.pending = []
+
+    def get_transaction_status(self):
+        return 2 if self.pending else 0
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, conn: FakeConn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, rows=None):
+        self.conn._check()
+        if rows:
+            self.conn.pending.extend(rows)
+            if self.conn.autocommit:
+                self.conn.commit()
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(sinks, "execute_values", lambda cur, sql, rows, template=None, page_size=100: cur.execute(sql, rows))
+    return FakeServer()
+
+
+def make_pool(server, **kw):
+    kw.setdefault("max_retries", 3)
+    return PgPool(connect=server.connect, backoff_base=0, **kw)
+
+
+def test_backoff_doubles_up_to_the_cap():
+    pool = PgPool(backoff_base=1.0, backoff_max=5.0)
+    for attempt, delay in enumerate([1, 2, 4, 5, 5]):
+        assert delay / 2 <= pool.backoff(attempt) <= delay
+
+
+def test_pool_reuses_healthy_connections_and_drops_dead_ones(server):
+    pool = make_pool(server)
+    with pool.connection() as conn:
+        pass
+    with pool.connection() as again:
+        assert again is conn
+    server.restart()
+    with pool.connection() as fresh:
+        assert fresh is not conn and not fresh.closed
+    assert server.connects == 2
+
+
+def test_pool_gives_up_after_max_retries(server):
+    pool = make_pool(server, max_retries=2)
+    server.up = False
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    assert server.connects == 3
+    server.up = True
+    pool.putconn(pool.getconn())  # the failed attempt released its slot
+
+
+def test_connection_lost_only_for_dead_connections(server):
+    conn = server.connect()
+    assert not connection_lost(psycopg2.OperationalError("deadlock detected"), conn)
+    assert not connection_lost(ValueError(), None)
+    conn.closed = 2
+    assert connection_lost(psycopg2.OperationalError("gone"), conn)
+    assert connection_lost(psycopg2.InterfaceError("connection already closed"), conn)
+
+
+def test_sink_replays_uncommitted_rows_after_a_restart(server):
+    sink = PostgresSink(autocommit=False, pool=make_pool(server))
+    sink.write_many([make_event(1), make_event(2)])
+    server.restart(refuse=2)  # before the commit: the transaction is lost
+    sink.write_many([make_event(3)])
+    sink.flush()
+
+    assert sorted(server.rows) == ["evt_1", "evt_2", "evt_3"]
+    assert sink.reconnects == 1 and server.connects == 4 and sink.written == 3
+    sink.close()
+
+
+def test_batching_sink_keeps_the_batch_while_postgres_is_down(server):
+    pool = make_pool(server, max_retries=1)
+    sink = BatchingSink(PostgresSink(autocommit=False, pool=pool), BatchController(initial_size=2, min_size=1))
+    sink.write(make_event(1))
+    sink.write(make_event(2))
+    server.up = False
+    with pytest.raises(psycopg2.OperationalError):
+        sink.flush()
+    assert len(sink.pending) == 2 and not server.rows
+
+    server.restart()
+    sink.write(make_event(3))
+    sink.close()
+    assert sorted(server.rows) == ["evt_1", "evt_2", "evt_3"] and sink.written == 3
+
+
+def test_load_summary_matches_batch_stats(server, monkeypatch):
+    conn = server.connect()
+    rows = [
+        ("total", "", "USD", 3, 1150, 1, 999),
+        ("total", "", "EUR", 1, 225, 225, 225),
+        ("status", "PLACED", "USD", 3, 1150, 1, 999),
+        ("status", "SHIPPED", "EUR", 1, 225, 225, 225),
+        ("event_type", "order_created", "USD", 3, 1150, 1, 999),
+        ("event_type", "order_created", "EUR", 1, 225, 225, 225),
+        ("category", "books", "USD", 3, 1150, 1, 999),
+        ("category", "books", "EUR", 1, 225, 225, 225),
+    ]
+    monkeypatch.setattr(FakeCursor, "fetchall", lambda self: rows, raising=False)
+
+    stats = load_summary(conn, group_by="category")
+    assert (stats.count, stats.total, stats.min_amount, stats.max_amount) == (4, Decimal("13.75"), Decimal("0.01"), Decimal("9.99"))
+    assert stats.status_counts == {"PLACED": 3, "SHIPPED": 1}
+    assert stats.type_counts == {"order_created": 4}
+    assert dict(stats.group_totals) == {"books": Decimal("13.75")}
+    assert dict(load_summary(conn, group_by="currency").group_totals) == {"USD": Decimal("11.50"), "EUR": Decimal("2.25")}
+
+
+# the tests below run against a real server (PG_HOST/PG_PORT/...), each in a
+# scratch schema, and are skipped when none is reachable
+
+
+@pytest.fixture
+def pg():
+    """connect() for a fresh schema on the local Postgres"""
+    def connect(**kw):
+        return psycopg2.connect(host=PG_HOST, port=PG_PORT, user=PG_USER, password=PG_PASSWORD, dbname=PG_DB, connect_timeout=2, **kw)
+
+    try:
+        admin = connect()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no Postgres at {PG_HOST}:{PG_PORT}: {str(e).strip().splitlines()[0]}")
+    admin.autocommit = True
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    try:
+        yield lambda: connect(options=f"-c search_path={schema}")
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+
+def make_events(ids, categories=("books", "toys")) -> list:
+    return [
+        make_event(i, status=("PLACED", "SHIPPED")[i % 2], currency=("USD", "EUR")[i % 3 == 0], amount=f"{i}.25", category=categories[i % len(categories)])
+        for i in ids
+    ]
+
+
+def stats_of(events, group_by=None) -> BatchStats:
+    stats = BatchStats(group_by)
+    stats.add(EventBatch.from_events(events))
+    return stats
+
+
+def figures(stats: BatchStats) -> tuple:
+    return (stats.count, stats.total, stats.min_amount, stats.max_amount,
+            dict(stats.status_counts), dict(stats.type_counts), dict(stats.group_totals))
+
+
+def test_postgres_summary_counts_duplicates_and_replays_once(pg):
+    pool = PgPool(connect=pg)
+    sink = PostgresSink(autocommit=False, pool=pool)
+    events = make_events(range(10))
+    sink.write_many(events[:6] + events[:2])  # duplicates inside one statement
+    sink.flush()
+    sink.write_many(events[4:8])  # overlaps the committed batch
+    sink.flush()
+    sink.write_batch(EventBatch.from_events(events))  # full replay through the columnar path
+    sink.flush()
+    sink.close()
+
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM orders_events")
+            assert cur.fetchone()[0] == 10
+        for group_by in ("category", "currency", "status"):
+            assert figures(load_summary(conn, group_by)) == figures(stats_of(events, group_by))
+    assert dict(stats_of(events, "category").group_totals) == {"books": Decimal("21.25"), "toys": Decimal("26.25")}
+    pool.closeall()
+
+
+# how rows were written before orders_summary existed: no summary delta
+LEGACY_INSERT = """
+INSERT INTO orders_events (
+    event_id, event_type, event_ts, order_id, customer_id, status, amount, currency, items_count
+) VALUES %s
+ON CONFLICT (event_id) DO NOTHING;
+"""
+LEGACY_VALUES = "(%(event_id)s, %(event_type)s, %(event_ts)s, %(order_id)s, %(customer_id)s, %(status)s, %(amount)s, %(currency)s, %(items_count)s)"
+
+
+def test_postgres_seed_races_with_new_writers_without_double_counting(pg):
+    # rows written before orders_summary existed: no summary, no category
+    legacy = make_events(range(20))
+    conn = pg()
+    with conn.cursor() as cur:
+        cur.execute(DDL)
+        execute_values(cur, LEGACY_INSERT, [e.model_dump() for e in legacy], template=LEGACY_VALUES)
+    conn.commit()
+
+    # every writer seeds on connect (ensure_db) and then writes its own events
+    writers = [make_events(range(20 + 5 * w, 25 + 5 * w), categories=(f"cat{w}",)) for w in range(4)]
+    start = threading.Barrier(len(writers))
+    errors = []
+
+    def write(events):
+        try:
+            start.wait()
+            sink = PostgresSink(autocommit=False, pool=PgPool(connect=pg))
+            sink.write_many(events + legacy[:3])  # legacy rows are already counted by the seed
+            sink.flush()
+            sink.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(events,)) for events in writers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+    new = [e for events in writers for e in events]
+    ensure_db(conn)  # already seeded: must not add the legacy rows again
+    summary = load_summary(conn, "category")
+    expected = stats_of(legacy + new)
+    assert figures(summary)[:6] == figures(expected)[:6]
+    # only events written through the summary upsert carry a category
+    assert dict(summary.group_totals) == dict(stats_of(new, "category").group_totals)
+    assert figures(load_summary(conn, "currency")) == figures(stats_of(legacy + new, "currency"))
+    conn.close()
@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from src.common.filters import FilterPlan, compile_filters
+from src.common.sinks import MemorySink
+from src.common.sources import MemoryBroker, MemorySource
+from src.consumer import stream_events, validate_file
+from tests.conftest import make_line
+
+
+def test_compile_filters_without_filters_is_none():
+    assert compile_filters() is None
+    assert compile_filters(status_filter=set()) is None
+    assert compile_filters(min_amount=Decimal("0")) is not None
+
+
+def test_filter_plan_checks_raw_bytes_and_payload():
+    plan = FilterPlan(status_filter={"SHIPPED"}, currency_filter={"EUR"}, min_amount=Decimal("5"), max_amount=Decimal("20"))
+    assert plan.match_bytes(make_line(1, status="SHIPPED", currency="EUR"))
+    assert not plan.match_bytes(make_line(1, status="PLACED", currency="EUR"))
+    assert not plan.match_bytes(make_line(1, status="SHIPPED", currency="USD"))
+
+    base = {"status": "SHIPPED", "currency": "EUR", "amount": 10.0}
+    assert plan.match_payload(base)
+    assert not plan.match_payload({**base, "amount": 20.01})
+    assert not plan.match_payload({**base, "amount": 4.99})
+    # a bad amount is left for validation to reject
+    assert plan.match_payload({**base, "amount": "lots"})
+
+
+def test_validate_file_applies_filters_before_stats_and_sink(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    lines = [
+        make_line(1, currency="USD", amount=10.0),
+        make_line(2, currency="EUR", amount=10.0),
+        make_line(3, currency="USD", amount=500.0),
+        b'{"status": "PLACED", "currency": "GBP", "amount": "oops"}',
+    ]
+    path.write_bytes(b"\n".join(lines) + b"\n")
+
+    sink = MemorySink()
+    ok, err, total, status_counts, _, min_amt, max_amt, *_ = validate_file(
+        path, currency_filter={"USD"}, max_amount=Decimal("100"), sink=sink,
+    )
+    assert (ok, err) == (1, 0)
+    assert total == Decimal("10.0")
+    assert (min_amt, max_amt) == (Decimal("10.0"), Decimal("10.0"))
+    assert [e.event_id for e in sink.events] == ["evt_1"]
+
+
+def test_stream_events_applies_filters():
+    broker = MemoryBroker(partitions=2)
+    for i in range(10):
+        broker.produce("orders", make_line(i, status="SHIPPED" if i % 2 else "PLACED"))
+
+    sink = MemorySink()
+    plan = compile_filters(status_filter={"SHIPPED"})
+    count, written = stream_events(MemorySource(broker, "orders", "g1"), sink, filters=plan)
+    assert (count, written) == (5, 5)
+    assert {e.status for e in sink.events} == {"SHIPPED"}
@@ -0,0 +1,176 @@
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+from src.common.batching import BatchController
+from src.common.lifecycle import DrainTimeout, ShutdownSignal
+from src.common.sinks import BatchingSink, MemorySink
+from src.common.sources import MemoryBroker, MemorySource
+import src.consumer as consumer
+from src.consumer import stream_events
+from tests.conftest import make_broker, make_line
+
+
+def fixed_batches(size: int) -> BatchController:
+    # flushes on size only: the interval is far longer than any test
+    return BatchController(target_p99_ms=120_000, min_size=size, max_size=size, initial_size=size, max_interval=60)
+
+
+def committed(broker: MemoryBroker, partitions: int = 2) -> int:
+    return sum(broker.committed_offset("g1", "orders", p) or 0 for p in range(partitions))
+
+
+class ScriptedSource(MemorySource):
+    """MemorySource that runs `actions[n]` before its n-th poll"""
+
+    def __init__(self, broker, actions):
+        super().__init__(broker, "orders", "g1", auto_commit=False, stop_at_end=False)
+        self.actions = actions
+        self.polls = 0
+
+    def poll(self, timeout: float = 1.0):
+        self.polls += 1
+        action = self.actions.get(self.polls)
+        if action:
+            action(self)
+        return super().poll(timeout)
+
+
+def test_offsets_never_run_ahead_of_the_sink():
+    broker = make_broker(10, partitions=2)
+    inner = MemorySink()
+    sink = BatchingSink(inner, fixed_batches(4))
+    seen = []
+
+    class Source(MemorySource):
+        def commit_offsets(self, offsets, asynchronous=False):
+            seen.append((sum(offsets.values()), inner.written))
+            super().commit_offsets(offsets, asynchronous)
+
+    count, _ = stream_events(Source(broker, "orders", "g1", auto_commit=False), sink, commit_interval=0)
+    assert count == 10 and inner.written == 10
+    assert seen and all(offset <= flushed for offset, flushed in seen)
+    assert committed(broker) == 10
+
+
+class FailingSink(MemorySink):
+    """Fails `failures` times on evt_5 (like a dropped connection), always rejects evt_6"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def write(self, evt):
+        if evt.event_id == "evt_5":
+            self.attempts += 1
+            if self.attempts <= self.failures:
+                raise OSError("disk full")
+        if evt.event_id == "evt_6":
+            raise ValueError("does not fit")
+        super().write(evt)
+
+
+def test_failed_write_is_retried_before_its_partition_moves_on():
+    broker = make_broker(10, partitions=2)
+    sink = FailingSink(failures=2)
+    seen = []
+
+    class Source(MemorySource):
+        def commit_offsets(self, offsets, asynchronous=False):
+            # evt_5 is offset 2 of partition 1
+            seen.append((offsets.get(1, 0), "evt_5" in {e.event_id for e in sink.events}))
+            super().commit_offsets(offsets, asynchronous)
+
+    count, inserted = stream_events(Source(broker, "orders", "g1", auto_commit=False), sink, commit_interval=0, retry_max=0.01)
+    assert sink.attempts == 3 and (count, inserted) == (10, 9)
+    assert [e.event_id for e in sink.events].count("evt_5") == 1
+    assert all(offset <= 2 or written for offset, written in seen)
+    # the rejected evt_6 is dropped, not retried
+    assert committed(broker) == 10
+
+
+def test_shutdown_stops_retrying_a_failed_write():
+    broker = make_broker(10, partitions=2)
+    sink = FailingSink(failures=10**6)
+    shutdown = ShutdownSignal()
+    source = ScriptedSource(broker, {30: lambda s: shutdown.request("SIGTERM")})
+
+    stream_events(source, sink, shutdown=shutdown, retry_max=0.01)
+    assert broker.committed_offset("g1", "orders", 1) == 2
+    assert broker.committed_offset("g1", "orders", 0) == 5
+
+
+def test_shutdown_drains_pending_batch_and_commits():
+    broker = make_broker(20, partitions=2)
+    inner = MemorySink()
+    sink = BatchingSink(inner, fixed_batches(100))
+    shutdown = ShutdownSignal()
+    source = ScriptedSource(broker, {8: lambda s: shutdown.request("SIGTERM")})
+
+    count, _ = stream_events(source, sink, shutdown=shutdown)
+    # the message polled when the signal arrived is still handled
+    assert count == 8 and inner.written == 8 and not sink.pending
+    assert committed(broker) == 8
+    # a new member of the group resumes right after the drained events
+    assert MemorySource(broker, "orders", "g1").poll().offset() == 4
+
+
+def test_revoke_flushes_and_commits_before_hand_over():
+    broker = make_broker(12, partitions=2)
+    inner = MemorySink()
+    sink = BatchingSink(inner, fixed_batches(100))
+    state = {}
+
+    def revoke(source):
+        source.on_revoke([0, 1])
+        state["flushed"], state["committed"] = inner.written, committed(broker)
+
+    shutdown = ShutdownSignal()
+    source = ScriptedSource(broker, {6: revoke, 10: lambda s: shutdown.request("SIGTERM")})
+    stream_events(source, sink, shutdown=shutdown)
+    assert state == {"flushed": 5, "committed": 5}
+    assert committed(broker) == 10 and inner.written == 10
+
+
+def test_drain_is_bounded():
+    broker = make_broker(3, partitions=2)
+
+    class SlowSink(MemorySink):
+        def flush(self):
+            time.sleep(0.3)
+
+    with pytest.raises(DrainTimeout):
+        stream_events(MemorySource(broker, "orders", "g1", auto_commit=False), SlowSink(), drain_timeout=0.05)
+    # the abandoned drain thread finishes its flush but no longer commits
+    time.sleep(0.4)
+    assert committed(broker) == 0
+
+
+def test_aborted_drain_exits_non_zero(tmp_path, monkeypatch):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(make_line(1) + b"\n")
+
+    def abort(*args, **kw):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(consumer, "stream_events", abort)
+    monkeypatch.setattr(sys, "argv", ["consumer.py", "--source", "memory", "--sink", "null", "--file", str(path)])
+    with pytest.raises(SystemExit) as exc:
+        consumer.main()
+    assert exc.value.code == 1
+
+
+def test_second_signal_aborts():
+    shutdown = ShutdownSignal().install((signal.SIGTERM,))
+    try:
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert shutdown.requested() and shutdown.reason == "SIGTERM"
+        with pytest.raises(KeyboardInterrupt):
+            os.kill(os.getpid(), signal.SIGTERM)
+    finally:
+        shutdown.restore()
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
@@ -0,0 +1,92 @@
+import pstats
+import tracemalloc
+
+from src.common.profiling import NULL_PROFILER, Profiler, start_profiling
+from src.common.replay import replay
+from src.common.sinks import MemorySink
+from src.common.sources import MemoryPartitionSource
+from src.consumer import validate_file
+from tests.conftest import make_broker, make_line
+
+
+def test_stage_samples_one_in_n_calls():
+    prof = Profiler("unused", sample_every=4)
+    st = prof.stage("parse")
+    assert prof.stage("parse") is st
+    for _ in range(10):
+        with st:
+            sum(range(100))
+    assert (st.calls, st.sampled) == (10, 2)
+    cpu, wall = st.estimate()
+    assert cpu >= 0 and wall > 0
+
+
+def test_start_profiling_without_path_is_a_no_op():
+    assert start_profiling(None) is NULL_PROFILER
+    with NULL_PROFILER.stage("read"):
+        pass
+
+
+def test_profiler_writes_stage_and_pstats_reports(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(make_line(i) for i in range(200)) + b"\n")
+    out = tmp_path / "profile.txt"
+
+    prof = Profiler(out, sample_every=2, use_cprofile=True, trace_alloc=True).start()
+    try:
+        validate_file(path, profiler=prof)
+    finally:
+        prof.stop()
+
+    report = out.read_text(encoding="utf-8")
+    for stage in ("read", "parse", "validate", "aggregate"):
+        assert f"\n{stage} " in report
+    assert "Allocations (top" in report and " at 0.0 KiB live" not in report
+    assert "cProfile (top" in report
+    assert pstats.Stats(str(out) + ".pstats").total_calls > 0
+
+
+def test_default_profiler_only_samples_stages(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(make_line(i) for i in range(200)) + b"\n")
+    out = tmp_path / "profile.txt"
+
+    prof = Profiler(out).start()
+    assert not tracemalloc.is_tracing()
+    try:
+        validate_file(path, profiler=prof)
+    finally:
+        prof.stop()
+
+    report = out.read_text(encoding="utf-8")
+    assert "\nparse " in report
+    assert "Allocations" not in report and "cProfile" not in report
+    assert not (tmp_path / "profile.txt.pstats").exists()
+
+
+def test_allocation_snapshots_are_rate_limited(tmp_path):
+    prof = Profiler(tmp_path / "profile.txt", trace_alloc=True, snapshot_interval=60).start()
+    try:
+        keep = [bytearray(1 << 20)]
+        prof.checkpoint()
+        first = prof._snapshot
+        keep += [bytearray(1 << 20) for _ in range(4)]
+        prof.checkpoint()  # grew well over 10%, but within the interval
+        assert first is not None and prof._snapshot is first
+    finally:
+        prof.stop()
+
+
+def test_replay_workers_show_up_in_cprofile(tmp_path):
+    broker = make_broker()
+    out = tmp_path / "profile.txt"
+
+    prof = Profiler(out, use_cprofile=True).start()
+    try:
+        replay(broker.partition_ranges("orders", None, None), lambda p, s, e: MemoryPartitionSource(broker, "orders", p, s, e), MemorySink, profiler=prof)
+    finally:
+        prof.stop()
+
+    functions = {name for _, _, name in pstats.Stats(str(out) + ".pstats").stats}
+    assert "replay_partition" in functions
+    assert "\nvalidate " in out.read_text(encoding="utf-8")
@@ -0,0 +1,142 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+from confluent_kafka import KafkaError, TopicPartition
+
+import src.common.sources as sources
+from src.common.replay import replay, replay_partition
+from src.common.sinks import MemorySink
+from src.common.sources import KafkaPartitionSource, Message, MemoryBroker, MemoryPartitionSource, MemorySource
+from tests.conftest import RejectingSink, make_broker, make_line
+
+
+def test_partition_ranges_resolve_timestamps():
+    broker = make_broker()
+    assert broker.partition_ranges("orders", None, None) == [(0, 0, 10), (1, 0, 10), (2, 0, 10)]
+    # events 6..14 → partition p holds i with i % 3 == p at offset i // 3
+    assert broker.partition_ranges("orders", 1006 * 1000, 1015 * 1000) == [(0, 2, 5), (1, 2, 5), (2, 2, 5)]
+    # nothing at or after from_ts → empty range at the end of the partition
+    assert broker.partition_ranges("orders", 5000 * 1000, None) == [(0, 10, 10), (1, 10, 10), (2, 10, 10)]
+
+
+def test_replay_reads_each_partition_to_its_end_offset():
+    broker = make_broker()
+    ranges = broker.partition_ranges("orders", 1006 * 1000, 1015 * 1000)
+    sinks: list[MemorySink] = []
+
+    def open_sink():
+        sinks.append(MemorySink())
+        return sinks[-1]
+
+    ok, written, err = replay(
+        ranges, lambda p, s, e: MemoryPartitionSource(broker, "orders", p, s, e), open_sink, batch_size=2,
+    )
+    assert (ok, written, err) == (9, 9, 0)
+    assert sorted(e.event_id for s in sinks for e in s.events) == sorted(f"evt_{i}" for i in range(6, 15))
+
+
+def test_replay_does_not_touch_group_offsets():
+    broker = make_broker()
+    live = MemorySource(broker, "orders", "live")
+    for _ in range(4):
+        live.poll()
+    before = dict(broker.committed)
+
+    replay(broker.partition_ranges("orders", None, None), lambda p, s, e: MemoryPartitionSource(broker, "orders", p, s, e), lambda: None)
+    assert broker.committed == before
+
+
+class FakeKafkaConsumer:
+    """Hands out scripted poll() results; the position follows the last offset read"""
+
+    script: list = []
+
+    def __init__(self, conf: dict):
+        self.conf = conf
+        self.polls = list(self.script)
+        self.pos = -1001
+
+    def assign(self, partitions):
+        self.pos = partitions[0].offset
+
+    def poll(self, timeout):
+        if not self.polls:
+            return None
+        item = self.polls.pop(0)
+        if isinstance(item, int):
+            # offsets skipped without a message, like a transaction marker
+            self.pos = item
+            return None
+        if item.error() is None:
+            self.pos = item.offset() + 1
+        return item
+
+    def position(self, partitions):
+        return [TopicPartition(p.topic, p.partition, self.pos) for p in partitions]
+
+    def close(self):
+        pass
+
+
+class EofMessage:
+    def error(self):
+        return KafkaError(KafkaError._PARTITION_EOF)
+
+
+def kafka_partition(monkeypatch, script, start, end) -> KafkaPartitionSource:
+    monkeypatch.setattr(FakeKafkaConsumer, "script", script)
+    monkeypatch.setattr(sources, "KafkaConsumer", FakeKafkaConsumer)
+    return KafkaPartitionSource("orders", 0, start, end, group_id="replay")
+
+
+def test_kafka_partition_ends_when_last_offsets_are_not_messages(monkeypatch):
+    # offsets 2 and 3 are control records: the message at end - 1 never comes
+    source = kafka_partition(monkeypatch, [Message("orders", 0, i, make_line(i)) for i in range(2)] + [4], 0, 4)
+    assert source.consumer.conf["enable.partition.eof"] and source.consumer.conf["auto.offset.reset"] == "earliest"
+    ok, written, err = replay_partition(source, MemorySink())
+    assert (ok, written, err) == (2, 2, 0) and source.exhausted
+
+
+def test_kafka_partition_ends_on_partition_eof(monkeypatch):
+    source = kafka_partition(monkeypatch, [Message("orders", 0, 5, make_line(5)), EofMessage()], 5, 9)
+    assert replay_partition(source, MemorySink())[0] == 1 and source.exhausted
+
+
+def test_replay_drops_rows_the_sink_rejects():
+    broker = make_broker()
+    sinks: list[RejectingSink] = []
+
+    def open_sink():
+        sinks.append(RejectingSink({"evt_4", "evt_20"}))
+        return sinks[-1]
+
+    ok, written, err = replay(
+        broker.partition_ranges("orders", None, None), lambda p, s, e: MemoryPartitionSource(broker, "orders", p, s, e), open_sink, batch_size=4,
+    )
+    assert (ok, written, err) == (28, 28, 2)
+    assert sorted(e.event_id for s in sinks for e in s.events) == sorted(f"evt_{i}" for i in range(30) if i not in (4, 20))
+
+
+def test_replay_stops_its_workers_on_keyboard_interrupt():
+    opened = []
+
+    class EndlessSource(MemorySource):
+        def poll(self, timeout: float = 1.0):
+            time.sleep(0.01)
+            return None
+
+    def open_source(partition, start, end):
+        opened.append(partition)
+        return EndlessSource(MemoryBroker(), "orders", "replay", stop_at_end=False)
+
+    threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGINT)).start()
+    started = time.perf_counter()
+    with pytest.raises(KeyboardInterrupt):
+        replay([(p, 0, 10) for p in range(4)], open_source, MemorySink, workers=3)
+    assert time.perf_counter() - started < 3
+    assert not [t for t in threading.enumerate() if t.name.startswith("ThreadPoolExecutor")]
+    # the fourth range was cancelled before a worker picked it up
+    assert sorted(opened) == [0, 1, 2]
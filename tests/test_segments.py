@@ -0,0 +1,126 @@
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from src.common.columnar import EventBatch, to_micros
+from src.common.filters import FilterPlan
+from src.common.segments import Segment, SegmentSink, list_segments, scan_segments, summarize_segments, write_segment
+from src.common.sinks import MemorySink
+from src.consumer import main, validate_file, validate_segments
+from tests.conftest import make_event, make_line
+
+
+def test_segment_round_trip_is_zero_copy(tmp_path):
+    events = [make_event(1, amount="12.34"), make_event(2, status="SHIPPED", currency="INR", category="beauty")]
+    path = tmp_path / "00000001.seg"
+    write_segment(path, EventBatch.from_events(events))
+
+    seg = Segment(path)
+    assert seg.rows == 2 and seg.categories == ["books", "beauty"]
+    amounts = seg.column("amount_cents")
+    assert amounts.tolist() == [1234, 1000] and not amounts.flags.owndata and not amounts.flags.writeable
+
+    batch = seg.batch()
+    assert list(batch.order_id) == ["ord_1", "ord_2"]
+    assert [e.model_dump() for e in batch.to_events()] == [e.model_dump() for e in events]
+    assert list(batch.take(np.array([False, True])).event_id) == ["evt_2"]
+
+
+def test_footer_stats_skip_segments(tmp_path):
+    sink = SegmentSink(tmp_path)
+    sink.write_batch(EventBatch.from_events([make_event(i, amount="5.00") for i in range(3)]))
+    sink.write_batch(EventBatch.from_events([make_event(i, amount="500.00", currency="EUR") for i in range(3, 6)]))
+    cheap, dear = (Segment(p) for p in list_segments(tmp_path))
+
+    assert not cheap.may_match(FilterPlan(min_amount=Decimal("100")), None, None)
+    assert dear.may_match(FilterPlan(min_amount=Decimal("100")), None, None)
+    assert not cheap.may_match(FilterPlan(currency_filter={"EUR"}), None, None)
+    assert not dear.may_match(None, None, to_micros(make_event(3).event_ts))
+    assert [len(b) for b in scan_segments(tmp_path, FilterPlan(currency_filter={"EUR"}))] == [3]
+
+
+def test_sink_appends_new_files_and_buffers_single_events(tmp_path):
+    first = SegmentSink(tmp_path)
+    first.write_batch(EventBatch.from_events([make_event(1)]))
+    first.close()
+
+    second = SegmentSink(tmp_path)
+    second.write_many([make_event(2), make_event(3)])
+    assert list_segments(tmp_path) == first.segments
+    second.close()
+    assert [p.name for p in list_segments(tmp_path)] == ["00000001.seg", "00000002.seg"]
+    assert second.written == 2 and Segment(second.segments[0]).rows == 2
+
+
+def test_segments_summarize_like_the_jsonl_file(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(
+        make_line(i, status=("PLACED", "SHIPPED")[i % 2], currency=("USD", "EUR")[i % 3 == 0], amount=1.25 * i)
+        for i in range(40)
+    ) + b"\n")
+    seg_dir = tmp_path / "segments"
+
+    from_file = validate_file(path, group_by="currency", batch_size=16, to_segments=seg_dir)
+    assert len(list_segments(seg_dir)) == 3
+    ok, err, total, status_counts, type_counts, lo, hi, dups, groups = validate_segments(seg_dir, group_by="currency")
+    assert (ok, err, total, status_counts, type_counts, dups) == from_file[:5] + (0,)
+    assert (lo, hi) == (Decimal("0.00"), Decimal("48.75"))
+    assert dict(groups) == dict(from_file[8])
+
+    plan = FilterPlan(status_filter={"SHIPPED"}, min_amount=Decimal("20"))
+    out = MemorySink()
+    stats = summarize_segments(seg_dir, plan, sink=out)
+    assert stats.count == len(out.events) == validate_file(path, filters=plan)[0]
+    assert all(e.status == "SHIPPED" and e.amount >= 20 for e in out.events)
+
+
+def outliers(monkeypatch, caplog, *argv) -> list[str]:
+    monkeypatch.setattr(sys, "argv", ["consumer.py", "--detect-outliers", *argv])
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        main()
+    return sorted(r.getMessage().split("order_id=")[1].split(" ")[0] for r in caplog.records if r.getMessage().startswith("Outlier"))
+
+
+def test_outliers_come_from_the_reported_events_for_both_inputs(tmp_path, monkeypatch, caplog):
+    path = tmp_path / "orders.jsonl"
+    # SHIPPED events average 10.00; the 50.00 PLACED ones are only outliers without the filter
+    amounts = [10, 50, 10, 50, 2, 50, 30, 50, 8, 50]
+    path.write_bytes(b"\n".join(
+        make_line(i, status=("SHIPPED", "PLACED")[i % 2], amount=a) for i, a in enumerate(amounts)
+    ) + b"\n")
+    seg_dir = tmp_path / "segments"
+    validate_file(path, to_segments=seg_dir)
+
+    from_file = outliers(monkeypatch, caplog, "--file", str(path), "--status", "SHIPPED")
+    assert from_file == outliers(monkeypatch, caplog, "--segments", str(seg_dir), "--status", "SHIPPED")
+    assert from_file == ["ord_4", "ord_6"]
+    # --limit 3 keeps SHIPPED 10, 10, 2: avg 7.33, so only the 2.00 one is below 3.67
+    assert outliers(monkeypatch, caplog, "--file", str(path), "--status", "SHIPPED", "--limit", "3") == ["ord_4"]
+
+
+def test_segments_reject_file_only_flags(tmp_path, monkeypatch):
+    for flag in ("--limit=5", "--check-duplicates"):
+        monkeypatch.setattr(sys, "argv", ["consumer.py", "--segments", str(tmp_path), flag])
+        with pytest.raises(SystemExit) as exc:
+            main()
+        assert exc.value.code == 2
+
+
+def test_file_and_segments_apply_the_same_time_window(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(
+        json.dumps({**json.loads(make_line(i, amount=float(i))), "event_ts": f"2025-08-21T{i:02d}:30:00Z"}).encode() for i in range(24)
+    ) + b"\n")
+    seg_dir = tmp_path / "segments"
+    validate_file(path, to_segments=seg_dir)
+    window = dict(from_ts=datetime(2025, 8, 21, 6, tzinfo=timezone.utc), to_ts=datetime(2025, 8, 21, 9, tzinfo=timezone.utc))
+
+    ok, err, total, *_ = validate_file(path, **window)
+    assert (ok, err, total) == (3, 0, Decimal("21.00"))
+    assert validate_segments(seg_dir, **window)[:3] == (ok, err, total)
@@ -0,0 +1,112 @@
+import pytest
+
+from src.common.sinks import CsvSink, MemorySink, NullSink, Sink
+from src.common.sources import FileSource, MemoryBroker, MemorySource, Source
+from src.consumer import stream_events, validate_file
+from tests.conftest import make_line
+
+
+def test_incomplete_sources_and_sinks_fail_on_creation():
+    class NoPoll(Source):
+        pass
+
+    class NoWrite(Sink):
+        def flush(self):
+            pass
+
+    with pytest.raises(TypeError):
+        NoPoll()
+    with pytest.raises(TypeError):
+        NoWrite()
+
+
+def test_memory_broker_partitions_and_offsets():
+    broker = MemoryBroker(partitions=3)
+    for i in range(9):
+        broker.produce("orders", make_line(i))
+    assert [broker.watermark_offsets("orders", p) for p in range(3)] == [(0, 3)] * 3
+
+    src = MemorySource(broker, "orders", "g1")
+    seen = [src.poll() for _ in range(9)]
+    assert sorted((m.partition(), m.offset()) for m in seen) == [(p, o) for p in range(3) for o in range(3)]
+    assert src.poll() is None and src.exhausted
+
+
+def test_memory_source_resumes_from_committed_offsets():
+    broker = MemoryBroker(partitions=2)
+    for i in range(6):
+        broker.produce("orders", make_line(i))
+
+    src = MemorySource(broker, "orders", "g1", auto_commit=False)
+    first = src.poll()
+    src.commit(message=first)
+    src.poll()  # consumed but never committed
+
+    again = MemorySource(broker, "orders", "g1")
+    assert again.positions[first.partition()] == first.offset() + 1
+    assert sum(1 for _ in iter(again.poll, None)) == 5
+    # a different group starts from the beginning
+    assert MemorySource(broker, "orders", "g2").positions == {0: 0, 1: 0}
+
+
+def test_stream_events_from_memory_broker():
+    broker = MemoryBroker(partitions=4)
+    for i in range(20):
+        broker.produce("orders", make_line(i))
+    broker.produce("orders", b"{not json")
+
+    sink = MemorySink()
+    count, written = stream_events(MemorySource(broker, "orders", "g1"), sink, metrics_every=5)
+    assert (count, written) == (20, 20)
+    assert sorted(e.event_id for e in sink.events) == sorted(f"evt_{i}" for i in range(20))
+    assert sink.flushes == 1
+
+
+def test_stream_events_respects_limit():
+    broker = MemoryBroker()
+    for i in range(10):
+        broker.produce("orders", make_line(i))
+    sink = NullSink()
+    assert stream_events(MemorySource(broker, "orders", "g1"), sink, limit=3) == (3, 3)
+    assert sink.written == 3
+
+
+def test_validate_file_writes_to_sink(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join([make_line(1), b"", make_line(2, status="SHIPPED"), b"{bad"]) + b"\n")
+
+    sink = MemorySink()
+    ok, err, total, status_counts, *_ = validate_file(path, sink=sink)
+    assert (ok, err) == (2, 1)
+    assert status_counts == {"PLACED": 1, "SHIPPED": 1}
+    assert [e.event_id for e in sink.events] == ["evt_1", "evt_2"]
+
+
+def test_validate_file_reads_from_source_into_csv(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(make_line(i) for i in range(3)) + b"\n")
+    out = tmp_path / "out.csv"
+
+    sink = CsvSink(out)
+    validate_file(None, source=FileSource(path), sink=sink)
+    sink.close()
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert lines[0].startswith("event_id,")
+    assert len(lines) == 4
+
+
+def test_sources_seek_back_to_a_message(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_bytes(b"\n".join(make_line(i) for i in range(3)) + b"\n")
+    file_source = FileSource(path)
+    broker = MemoryBroker(partitions=1)
+    for i in range(3):
+        broker.produce("orders", make_line(i))
+    memory_source = MemorySource(broker, "orders", "g1", auto_commit=False)
+
+    for source in (file_source, memory_source):
+        while source.poll() is not None:
+            pass
+        source.seek(0, 1)
+        assert [source.poll().offset(), source.poll().offset(), source.poll()] == [1, 2, None]
+    file_source.close()